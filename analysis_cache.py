@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+cache_dir = os.environ.get("EB1A_CACHE_DIR", os.path.join(base_dir, "cache"))
+memory_entries = int(os.environ.get("EB1A_CACHE_MEMORY_ENTRIES", "128"))
+disk_bytes = int(os.environ.get("EB1A_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+TEXT_FILE = "text.txt"
+ANALYSIS_FILE = "analysis.json"
+PDF_FILE = "report.pdf"
+
+
+def make_key(document_sha256, ext, version):
+    # The same bytes analyzed under different rules or models must not share an entry
+    return hashlib.sha256(f"{document_sha256}:{ext}:{version}".encode("utf-8")).hexdigest()
+
+
+_key_pattern = re.compile(r"[0-9a-f]{64}")
+
+def is_valid_key(key):
+    return bool(_key_pattern.fullmatch(key or ""))
+
+
+class AnalysisCache:
+    # Two tiers keyed by make_key(): an in-process LRU of the most recent entries, and
+    # one directory per entry on disk holding the extracted text, the findings JSON and
+    # the rendered PDF. The disk tier is trimmed oldest-first when it outgrows max_bytes;
+    # reading an entry refreshes its mtime so eviction approximates LRU.
+
+    def __init__(self, directory=cache_dir, max_entries=memory_entries, max_bytes=disk_bytes):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Running estimate of the disk tier size; the directory is only rescanned when
+        # the estimate crosses max_bytes
+        self._disk_total = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    #Lookup
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry
+
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, ANALYSIS_FILE), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(entry_dir)
+        except (OSError, ValueError):
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self.counters["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry
+
+    def get_text(self, key):
+        try:
+            with open(os.path.join(self._entry_dir(key), TEXT_FILE), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def pdf_path(self, key):
+        path = os.path.join(self._entry_dir(key), PDF_FILE)
+        return path if os.path.exists(path) else None
+
+    #Storage
+    def put(self, key, text, analysis, report_id=None, document_sha=None):
+        # document_sha lets a later draft name this analysis as the one it replaces
+        entry = {"analysis": analysis, "report_id": report_id, "document_sha": document_sha}
+        entry_dir = self._entry_dir(key)
+
+        # Build the entry beside its final location and rename it into place
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with open(os.path.join(staging, TEXT_FILE), "w", encoding="utf-8") as f:
+                f.write(text)
+            with open(os.path.join(staging, ANALYSIS_FILE), "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            for attempt in range(3):
+                if os.path.isdir(entry_dir):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                try:
+                    os.replace(staging, entry_dir)
+                    break
+                except OSError:
+                    # Another server worker stored the same key in between; entries are
+                    # content-addressed, so its copy is as good as ours
+                    if os.path.isdir(entry_dir):
+                        shutil.rmtree(staging, ignore_errors=True)
+                        break
+                    if attempt == 2:
+                        raise
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self.counters["stores"] += 1
+            self._remember(key, entry)
+        self._grow(self._dir_size(entry_dir))
+        return entry
+
+    def attach_pdf(self, key, pdf_path):
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix=f".{PDF_FILE}.", suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(pdf_path, tmp_path)
+            os.replace(tmp_path, os.path.join(entry_dir, PDF_FILE))
+        except OSError:
+            # The entry was evicted meanwhile, possibly by another server worker
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._grow(os.path.getsize(pdf_path))
+
+    #Eviction
+    @staticmethod
+    def _dir_size(path):
+        # Entries can vanish mid-scan when another server worker evicts them
+        size = 0
+        try:
+            for f in os.scandir(path):
+                try:
+                    size += f.stat().st_size
+                except OSError:
+                    pass
+        except OSError:
+            pass
+        return size
+
+    def _disk_entries(self):
+        entries = []
+        for item in os.scandir(self.directory):
+            if item.is_dir() and not item.name.startswith("."):
+                try:
+                    mtime = item.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((mtime, self._dir_size(item.path), item.name))
+        return entries
+
+    def _grow(self, added):
+        with self._lock:
+            if self._disk_total is not None:
+                self._disk_total += added
+            needs_scan = self._disk_total is None or self._disk_total > self.max_bytes
+        if needs_scan:
+            self.evict()
+
+    def evict(self):
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            with self._lock:
+                self._memory.pop(key, None)
+                self.counters["evictions"] += 1
+        with self._lock:
+            self._disk_total = total
+
+    def lookup_counts(self):
+        with self._lock:
+            return {outcome: self.counters[outcome] for outcome in ("memory_hits", "disk_hits", "misses")}
+
+    def disk_usage(self):
+        # The running estimate kept by put/evict, for frequent readers such as /metrics.
+        # Only the first call in a process that has not stored anything yet scans the disk.
+        with self._lock:
+            total = self._disk_total
+        if total is None:
+            total = sum(size for _, size, _ in self._disk_entries())
+            with self._lock:
+                if self._disk_total is None:
+                    self._disk_total = total
+        return total
+
+    def stats(self):
+        entries = self._disk_entries()
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["disk_entries"] = len(entries)
+        stats["disk_bytes"] = sum(size for _, size, _ in entries)
+        stats["max_disk_bytes"] = self.max_bytes
+        return stats
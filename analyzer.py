@@ -0,0 +1,798 @@
+import io
+import os
+import re
+import math
+import time
+import heapq
+import hashlib
+import fitz
+import string
+import zipfile
+import itertools
+import threading
+import multiprocessing
+
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+from rule_packs import active_pack
+from classifier import ModelArtifactError, model_version, predict_strength
+from letter_similarity import find_similar_pairs, overlapping_passages
+
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+# Guards against pathological uploads exhausting worker memory
+max_pages = int(os.environ.get("EB1A_MAX_PAGES", "2000"))
+max_text_chars = int(os.environ.get("EB1A_MAX_TEXT_CHARS", str(20 * 1024 * 1024)))
+# PDFs with at least this many pages are extracted in page ranges across processes
+parallel_page_threshold = int(os.environ.get("EB1A_PARALLEL_PAGES", "150"))
+extract_workers = int(os.environ.get("EB1A_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class DocumentTooLarge(ValueError):
+    pass
+
+
+#File Utilities
+# Extractors accept a path or the raw bytes of an upload, so nothing touches disk
+def _open_pdf(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _extract_page_range(source, start, stop):
+    with _open_pdf(source) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _get_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(max_workers=extract_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _page_pool
+
+def _replace_broken_page_pool(broken):
+    # A page worker that crashed (e.g. inside PyMuPDF) breaks the whole pool for good
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not broken:
+            return
+        _page_pool = None
+    broken.shutdown(wait=False)
+    print("⚠️ PDF page pool broke; starting a new one")
+
+def _iter_page_ranges(source, page_count, attempts=2):
+    # Pages from a few ranges per worker, yielded back in page order as they finish. If the
+    # pool breaks, the pages not yielded yet are extracted again on a fresh pool; extracting
+    # them in this process instead could take the server down with the worker.
+    done = 0
+    for attempt in range(attempts):
+        step = math.ceil((page_count - done) / (extract_workers * 2))
+        starts = range(done, page_count, step)
+        stops = [min(start + step, page_count) for start in starts]
+        pool = _get_page_pool()
+        try:
+            for pages in pool.map(_extract_page_range, itertools.repeat(source), starts, stops):
+                for page_text in pages:
+                    done += 1
+                    yield page_text
+            return
+        except BrokenProcessPool:
+            _replace_broken_page_pool(pool)
+            if attempt == attempts - 1:
+                raise
+
+def _cap_text(pages, limit):
+    total = 0
+    for page_text in pages:
+        total += len(page_text)
+        if total > limit:
+            raise DocumentTooLarge(f"Document text exceeds {limit} characters")
+        yield page_text
+
+def iter_pdf_pages(pdf_path, page_limit=None, char_limit=None):
+    # Yields the text of each page in order, so segmentation can start on page one
+    page_limit = max_pages if page_limit is None else page_limit
+    char_limit = max_text_chars if char_limit is None else char_limit
+    if isinstance(pdf_path, (bytearray, memoryview)):
+        pdf_path = bytes(pdf_path)
+
+    with _open_pdf(pdf_path) as doc:
+        page_count = doc.page_count
+        if page_count > page_limit:
+            raise DocumentTooLarge(f"Document has {page_count} pages (limit {page_limit})")
+        if page_count < parallel_page_threshold or extract_workers < 2:
+            yield from _cap_text((page.get_text() for page in doc), char_limit)
+            return
+
+    # Large bundles are split across page worker processes
+    yield from _cap_text(_iter_page_ranges(pdf_path, page_count), char_limit)
+
+def extract_text_from_pdf(pdf_path):
+    return "".join(iter_pdf_pages(pdf_path))
+
+_w = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_office_document_type = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+_docx_p, _docx_tr, _docx_tc, _docx_t, _docx_br, _docx_body = (_w + tag for tag in ("p", "tr", "tc", "t", "br", "body"))
+_docx_br_type = _w + "type"
+# Run content that stands for a character, as python-docx reads it
+_docx_characters = {_w + "tab": "\t", _w + "ptab": "\t", _w + "cr": "\n", _w + "noBreakHyphen": "-"}
+# Deleted tracked changes, and the legacy copy of content Word also stores in a newer form
+_docx_skipped = {_w + "del", _w + "moveFrom", "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"}
+docx_chunk_chars = 64 * 1024
+
+def _docx_main_part(archive):
+    # Usually word/document.xml, but the package relationships have the final say
+    try:
+        rels = ElementTree.fromstring(archive.read("_rels/.rels"))
+    except KeyError:
+        return "word/document.xml"
+    for rel in rels:
+        if rel.get("Type") == _office_document_type:
+            return rel.get("Target").lstrip("/")
+    return "word/document.xml"
+
+def iter_docx_paragraphs(source, char_limit=None):
+    # Yields (offset, text) for every paragraph of the body in document order, straight from
+    # the XML in the zip; no object model is built and parsed elements are dropped at once.
+    # A table row is one line with its cells joined by " | ". Offsets are positions in the
+    # "\n"-joined text that extract_text_from_docx returns. Tracked insertions are kept and
+    # deletions dropped, i.e. the text as it reads with all changes accepted.
+    char_limit = max_text_chars if char_limit is None else char_limit
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as archive, archive.open(_docx_main_part(archive)) as xml:
+        offset = 0
+        # One list of lines per open table cell; lines outside every table are yielded
+        cells = []
+        rows = []
+        runs = []
+        skipped = 0
+        body = None
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag in _docx_skipped:
+                    skipped += 1
+                elif skipped:
+                    pass
+                elif tag == _docx_p:
+                    runs.append([])
+                elif tag == _docx_tr:
+                    rows.append([])
+                elif tag == _docx_tc:
+                    cells.append([])
+                elif tag == _docx_body:
+                    body = element
+                continue
+
+            if tag in _docx_skipped:
+                skipped -= 1
+                continue
+            if skipped:
+                continue
+            if tag == _docx_t:
+                runs[-1].append(element.text or "")
+                continue
+            if tag in _docx_characters:
+                runs[-1].append(_docx_characters[tag])
+                continue
+            if tag == _docx_br:
+                if element.get(_docx_br_type) in (None, "textWrapping"):
+                    runs[-1].append("\n")
+                continue
+            if tag == _docx_p:
+                line = "".join(runs.pop())
+            elif tag == _docx_tr:
+                line = " | ".join(rows.pop())
+            elif tag == _docx_tc:
+                rows[-1].append(" ".join(text for text in cells.pop() if text))
+                continue
+            else:
+                continue
+            if cells:
+                cells[-1].append(line)
+                continue
+            if offset + len(line) > char_limit:
+                raise DocumentTooLarge(f"Document text exceeds {char_limit} characters")
+            yield offset, line
+            offset += len(line) + 1
+            # A finished top-level paragraph or table is never needed again
+            if body is not None:
+                body.clear()
+
+def extract_text_from_docx(docx_path):
+    return "\n".join([text for _, text in iter_docx_paragraphs(docx_path)])
+
+def iter_docx_chunks(source):
+    # The extracted text in pieces of about docx_chunk_chars, so analysis starts before the
+    # whole document is parsed. Joined, the pieces equal extract_text_from_docx.
+    batch, size, first = [], 0, True
+    for _, text in iter_docx_paragraphs(source):
+        batch.append(text)
+        size += len(text) + 1
+        if size >= docx_chunk_chars:
+            yield ("" if first else "\n") + "\n".join(batch)
+            batch, size, first = [], 0, False
+    if batch or first:
+        yield ("" if first else "\n") + "\n".join(batch)
+
+def load_document(file_path):
+    if file_path.endswith(".pdf"):
+        return extract_text_from_pdf(file_path)
+    elif file_path.endswith(".docx"):
+        return extract_text_from_docx(file_path)
+    elif file_path.endswith(".txt"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+    else:
+        raise ValueError("Unsupported file format. Please use .pdf, .docx, or .txt")
+
+def iter_document_bytes(data, ext):
+    # Text chunks in reading order: one per page for PDFs, runs of paragraphs for DOCX,
+    # the whole text otherwise
+    if ext == ".pdf":
+        yield from iter_pdf_pages(data)
+    elif ext == ".docx":
+        yield from iter_docx_chunks(data)
+    else:
+        yield load_document_bytes(data, ext)
+
+def load_document_bytes(data, ext):
+    if ext == ".pdf":
+        return extract_text_from_pdf(data)
+    elif ext == ".docx":
+        return extract_text_from_docx(data)
+    elif ext == ".txt":
+        return bytes(data).decode("utf-8")
+    else:
+        raise ValueError("Unsupported file format. Please use .pdf, .docx, or .txt")
+
+#Criterion Segmentation
+criterion_header_pattern = re.compile(r"(Criterion\s+\d+\s*[:\-–]\s*[^\n]*)", re.IGNORECASE)
+letter_header_pattern = re.compile(
+    r"(Letter\s+from\s+[^\n]+|Recommendation\s+Letter\s+from\s+[^\n]+)", re.IGNORECASE
+)
+# Each kind of header, with the words (lowercase) a header of that kind can start with
+header_kinds = {
+    "criterion": (criterion_header_pattern, ("criterion",)),
+    "letter": (letter_header_pattern, ("letter", "recommendation")),
+}
+
+
+def _fold(text):
+    # Lowercase copy of the text for finding header words with str.find, which is far
+    # faster than letting an IGNORECASE regex try every position. IGNORECASE also lets
+    # "ı" match "i"; if lowercasing changes the length (e.g. "İ"), offsets no longer line
+    # up and None tells the caller to scan with the regex alone.
+    folded = text.lower()
+    if len(folded) != len(text):
+        return None
+    return folded.replace("ı", "i")
+
+def _kind_matches(text, folded, kind, pos):
+    # Leftmost non-overlapping header matches of one kind from pos, exactly as
+    # pattern.finditer (and so re.split) finds them
+    pattern, words = header_kinds[kind]
+    if folded is None:
+        yield from pattern.finditer(text, pos)
+        return
+    next_word = {word: folded.find(word, pos) for word in words}
+    while True:
+        for word, at in next_word.items():
+            if 0 <= at < pos:
+                next_word[word] = folded.find(word, pos)
+        starts = [at for at in next_word.values() if at >= 0]
+        if not starts:
+            return
+        start = min(starts)
+        match = pattern.match(text, start)
+        if match:
+            yield match
+            pos = match.end()
+        else:
+            pos = start + 1
+
+def iter_headers(text, starts):
+    # Every header of the kinds in `starts` ({kind: offset to scan from}) as (kind, match),
+    # in document order. Kinds are matched independently, so a letter header inside a
+    # criterion header line is still found, as separate re.split calls would find it.
+    folded = _fold(text)
+    streams = [
+        zip(itertools.repeat(kind), _kind_matches(text, folded, kind, pos)) for kind, pos in starts.items()
+    ]
+    return heapq.merge(*streams, key=lambda item: item[1].start())
+
+
+class SectionView:
+    # A criterion section or letter as offsets into the document text. Nothing is copied
+    # until header or body is read. Unpacks as (header, body).
+    __slots__ = ("text", "kind", "start", "header_end", "end")
+
+    def __init__(self, text, kind, start, header_end, end):
+        self.text, self.kind = text, kind
+        self.start, self.header_end, self.end = start, header_end, end
+
+    @property
+    def header(self):
+        return self.text[self.start:self.header_end].strip()
+
+    @property
+    def body(self):
+        return self.text[self.header_end:self.end].strip()
+
+    def __iter__(self):
+        return iter((self.header, self.body))
+
+    def __repr__(self):
+        return f"SectionView({self.kind!r}, {self.start}:{self.header_end}:{self.end})"
+
+
+def segment_document(text, kinds=tuple(header_kinds)):
+    # Criterion sections and recommendation letters in one pass over the text:
+    # {kind: [SectionView, ...]} in document order. A section runs from its header to the
+    # next header of the same kind; repeated headers each keep their own section.
+    sections = {kind: [] for kind in kinds}
+    open_headers = {}
+    for kind, match in iter_headers(text, dict.fromkeys(kinds, 0)):
+        if kind in open_headers:
+            sections[kind].append(SectionView(text, kind, *open_headers[kind], match.start()))
+        open_headers[kind] = (match.start(), match.end())
+    for kind, (start, header_end) in open_headers.items():
+        sections[kind].append(SectionView(text, kind, start, header_end, len(text)))
+    return sections
+
+def segment_by_criterion(text):
+    # {header: body}; a later section with a repeated header replaces the earlier one.
+    # segment_document keeps both.
+    return {section.header: section.body for section in segment_document(text, ("criterion",))["criterion"]}
+
+
+# Matches only when nothing but whitespace is left from the given position
+_trailing_space = re.compile(r"\s*\Z")
+
+
+class DocumentSegmenter:
+    # Incremental segment_document for text that arrives in chunks (e.g. PDF pages).
+    # feed() returns each (kind, header, body) as soon as the next header of that kind is
+    # seen; close() flushes the sections still open. Text before a kind's first header
+    # is dropped, as in segment_document.
+    #
+    # Headers end at a newline, and the \s in a header pattern can run across one, so a
+    # match followed by nothing but whitespace (e.g. "Letter from  \n" at the end of a
+    # page, whose name is on the next page) is only trusted once more text arrives. Any
+    # other match already stopped at text that later chunks cannot change. Only a short
+    # tail (`lookback` characters before any trailing whitespace, or from the start of an
+    # unfinished header) is rescanned, keeping the work linear. Chunks are kept (not concatenated) until no open section or
+    # rescan needs them.
+
+    def __init__(self, kinds=tuple(header_kinds), lookback=256):
+        self.kinds = kinds
+        self.lookback = lookback
+        self._pieces = []
+        self._length = 0
+        self._scan_from = 0
+        self._resume = dict.fromkeys(kinds, 0)
+        self._open = {}
+
+    def _slice(self, start, end):
+        parts = []
+        for offset, piece in self._pieces:
+            if offset < end and offset + len(piece) > start:
+                parts.append(piece[max(0, start - offset):end - offset])
+        return "".join(parts)
+
+    def _scan(self, final):
+        base = self._scan_from
+        text = self._slice(base, self._length)
+        starts = {kind: max(0, self._resume[kind] - base) for kind in self.kinds}
+        sections = []
+        unfinished = None
+        for kind, match in iter_headers(text, starts):
+            if not final and _trailing_space.match(text, match.end()):
+                unfinished = base + match.start()
+                break
+            if kind in self._open:
+                header, body_start = self._open[kind]
+                sections.append((kind, header, self._slice(body_start, base + match.start()).strip()))
+            self._open[kind] = (match.group(0).strip(), base + match.end())
+            self._resume[kind] = base + match.end()
+
+        if final:
+            for kind, (header, body_start) in self._open.items():
+                sections.append((kind, header, self._slice(body_start, self._length).strip()))
+            self._open = {}
+            self._pieces, self._scan_from = [], self._length
+            return sections
+
+        if unfinished is None:
+            # Blank lines after a header that has no name yet must not push it out of the window
+            unfinished = max(base, base + len(text.rstrip()) - self.lookback)
+        self._scan_from = unfinished
+        keep = min([self._scan_from] + [body_start for _, body_start in self._open.values()])
+        self._pieces = [(offset, piece) for offset, piece in self._pieces if offset + len(piece) > keep]
+        return sections
+
+    def feed(self, chunk):
+        self._pieces.append((self._length, chunk))
+        self._length += len(chunk)
+        return self._scan(final=False)
+
+    def close(self):
+        return self._scan(final=True)
+
+
+#Normalization
+_punctuation_table = str.maketrans('', '', string.punctuation)
+
+def normalize(text):
+    return text.lower().translate(_punctuation_table)
+
+#Expectation Matching
+def detect_missing_signals(text, criterion, hits=None, pack=None):
+    # `hits` is the set of phrases the compiled matcher already found in `text`
+    expected = (pack or active_pack()).expectations.get(criterion, [])
+    if hits is None:
+        return [f"Missing expected detail: {keyword}" for keyword in expected if keyword.lower() not in text]
+    return [f"Missing expected detail: {keyword}" for keyword in expected if keyword.lower() not in hits]
+
+def apply_advanced_rule_based_check(section_text, pack=None):
+    # Sections are checked one at a time on purpose: a batch form over a sparse
+    # sections × phrases matrix measured ~3x slower per document, since the automaton
+    # scan is most of the cost and the matrix setup does not pay off for a few sections
+    pack = pack or active_pack()
+    results = []
+    cleaned = normalize(section_text)
+    hits = pack.matcher.matched(cleaned)
+    for criterion, rule in pack.rules.items():
+        if any(k in hits for k in rule["keywords"]):
+            issues = []
+            for phrase, message in rule["red_flags"]:
+                if phrase in hits:
+                    issues.append(message)
+            issues += detect_missing_signals(cleaned, criterion, hits, pack)
+            results.append({
+                "matched_criterion": criterion,
+                "issues": issues or ["None detected"],
+                "excerpt": section_text[:300] + "..." if len(section_text) > 300 else section_text
+            })
+    return results
+
+def find_rule_matches(section_text, pack=None):
+    # {phrase: [offsets]} for every keyword, red flag and expected detail, in normalized text
+    return (pack or active_pack()).matcher.match_positions(normalize(section_text))
+
+
+
+#Evidence Strength
+_model_missing_reported = False
+
+def score_sections(sections):
+    # Classifier probability that each section reads as strong evidence; None without a model
+    global _model_missing_reported
+    try:
+        return predict_strength(sections)
+    except ModelArtifactError as e:
+        if not _model_missing_reported:
+            print(f"⚠️ Findings are not scored: {e}")
+            _model_missing_reported = True
+        return [None] * len(sections)
+
+
+
+#AAO Precedents
+def find_precedents(sections, criteria):
+    # For each section, {criterion: [precedent, ...]} from the AAO decision index, for the
+    # criteria in criteria[i]. Imported here because precedent_index builds on this module.
+    from precedent_index import get_precedent_index, top_k
+    if top_k <= 0:
+        return [{criterion: [] for criterion in wanted} for wanted in criteria]
+    try:
+        return get_precedent_index().search(sections, criteria)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Precedent index unavailable: {e}")
+        return [{criterion: [] for criterion in wanted} for wanted in criteria]
+
+
+
+#Recommendation Letter Analysis
+def extract_recommendation_letters(text):
+    return [tuple(letter) for letter in segment_document(text, ("letter",))["letter"]]
+
+# A document without letter headers is one letter only if it reads like one: short, no
+# "Criterion N:" headers, and a salutation or closing. Petition drafts and AAO decisions
+# must not be indexed whole, or every redraft would match its own earlier drafts.
+standalone_letter_words = int(os.environ.get("EB1A_STANDALONE_LETTER_WORDS", "1000"))
+letter_courtesy_pattern = re.compile(
+    r"\b(?:dear|to whom it may concern|sincerely|respectfully|(?:best|kind|warm) regards|yours)\b", re.IGNORECASE
+)
+
+def is_standalone_letter(text):
+    return (
+        len(text.split()) <= standalone_letter_words
+        and letter_courtesy_pattern.search(text) is not None
+        and not segment_document(text, ("criterion",))["criterion"]
+    )
+
+def letters_or_whole_document(text, label):
+    # Standalone letter files often have no "Letter from" header; treat them as one letter
+    letters = extract_recommendation_letters(text)
+    if not letters and text.strip() and is_standalone_letter(text):
+        letters = [(label, text.strip())]
+    return letters
+
+def find_repetitive_letters(letters, threshold=0.9, with_passages=True):
+    bodies = [normalize(body) for _, body in letters]
+    flags = []
+    for i, j, sim_score in find_similar_pairs(bodies, threshold):
+        flag = {"letter_1": letters[i][0], "letter_2": letters[j][0], "similarity": sim_score}
+        if with_passages:
+            flag["overlapping_passages"] = overlapping_passages(bodies[i], bodies[j])
+        flags.append(flag)
+    return flags
+
+def detect_repetitive_letters(letters, threshold=0.9):
+    return [
+        (flag["letter_1"], flag["letter_2"], flag["similarity"])
+        for flag in find_repetitive_letters(letters, threshold, with_passages=False)
+    ]
+
+def analyze_recommendation_folder(rec_folder_path):
+    rec_texts = []
+    for filename in os.listdir(rec_folder_path):
+        file_path = os.path.join(rec_folder_path, filename)
+        try:
+            text = load_document(file_path)
+            rec_texts.append((filename, text))
+            print(f"📄 Loaded recommendation: {filename}")
+        except Exception as e:
+            print(f"⚠️ Skipping {filename}: {e}")
+
+    full_text = "\n\n".join([t for _, t in rec_texts])
+    letters = extract_recommendation_letters(full_text)
+    flags = detect_repetitive_letters(letters)
+
+    if flags:
+        print("\n⚠️ Repetition Detected in Letters:")
+        for l1, l2, score in flags:
+            print(f" - {l1} ↔ {l2} | Similarity: {score:.2f}")
+    else:
+        print("\n✅ No significant repetition across letters.")
+
+
+#EB1A Rules
+# Keywords, red flags and expected details live in rule packs (rules/*.json), which
+# rule_packs.py loads, compiles and hot-reloads. Results carry the pack's version.
+
+
+#Full Pipeline
+def analysis_version(pack=None):
+    # The rules and the classifier both shape the findings, so cached results track both
+    return f"{(pack or active_pack()).version}-{model_version() or 'unscored'}"
+
+def section_sha(header, content):
+    return hashlib.sha256(f"{header}\n{content}".encode("utf-8")).hexdigest()
+
+def _reusable_results(previous, version):
+    # Sections and letters of a previous analysis, when it was made with the same rules and model
+    fingerprints = (previous or {}).get("fingerprints")
+    if not fingerprints or fingerprints.get("version") != version:
+        return {}, None
+    findings = {}
+    for finding in previous.get("rule_based_findings", []):
+        findings.setdefault(finding.get("section"), []).append(finding)
+    sections = {
+        header: (sha, findings.get(header, [])) for header, sha in fingerprints.get("sections", {}).items()
+    }
+    return sections, (fingerprints.get("letters"), previous.get("repetitive_letters"))
+
+def analysis_events(chunks, previous=None):
+    # The analysis pipeline as a stream of (event, payload) pairs, for clients that show
+    # results as they arrive:
+    #   ("page", ...)      after each chunk (PDF page) is extracted and segmented
+    #   ("section", ...)   as soon as a criterion section's rule checks are done
+    #   ("findings", ...)  every finding, once all sections are scored by the classifier and
+    #                      matched with AAO precedents
+    #   ("letters", ...)   repetitive letter flags
+    #   ("result", (text, analysis))  last, the same value analyze_chunks returns
+    #
+    # Rule checks run on each criterion section as soon as its last page has arrived.
+    # A repeated header keeps its own section, keyed "<header> (2)" and so on.
+    # Extraction, segmentation and rule checks interleave page by page, so their time is
+    # summed across pages and reported as one span each.
+    #
+    # With `previous` (an earlier analysis of another draft), sections whose header and
+    # text hash the same keep their earlier findings and scores instead of being rechecked.
+    # One rule pack for the whole document, even if a reload swaps the active one meanwhile
+    pack = active_pack()
+    version = analysis_version(pack)
+    segmenter = DocumentSegmenter()
+    previous_sections, previous_letters = _reusable_results(previous, version)
+    findings_by_header = {}
+    content_by_header = {}
+    section_hashes = {}
+    reused = set()
+    header_counts = {}
+    letters = []
+    pieces = []
+    timings = {"extract": 0.0, "segment": 0.0, "rules": 0.0}
+
+    def check(sections):
+        started = time.perf_counter()
+        checked = []
+        for header, content in sections:
+            header_counts[header] = header_counts.get(header, 0) + 1
+            if header_counts[header] > 1:
+                header = f"{header} ({header_counts[header]})"
+            sha = section_sha(header, content)
+            section_hashes[header] = sha
+            prior = previous_sections.get(header)
+            if prior is not None and prior[0] == sha:
+                findings_by_header[header] = [dict(finding) for finding in prior[1]]
+                reused.add(header)
+            else:
+                findings = apply_advanced_rule_based_check(content, pack)
+                for finding in findings:
+                    finding["section"] = header
+                findings_by_header[header] = findings
+                content_by_header[header] = content
+                reused.discard(header)
+            checked.append({"section": header, "findings": findings_by_header[header], "reused": header in reused})
+        timings["rules"] += time.perf_counter() - started
+        return checked
+
+    def split(final, chunk=None):
+        started = time.perf_counter()
+        sections = []
+        for kind, header, body in segmenter.close() if final else segmenter.feed(chunk):
+            (sections if kind == "criterion" else letters).append((header, body))
+        timings["segment"] += time.perf_counter() - started
+        return sections
+
+    chunks = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        timings["extract"] += time.perf_counter() - started
+        if chunk is None:
+            break
+        pieces.append(chunk)
+        checked = check(split(False, chunk))
+        yield "page", {"page": len(pieces), "characters": len(chunk)}
+        for section in checked:
+            yield "section", section
+    for section in check(split(True)):
+        yield "section", section
+
+    for stage, seconds in timings.items():
+        metrics.observe_stage(stage, seconds)
+    metrics.observe("eb1a_sections_found", len(findings_by_header))
+
+    # Every rechecked section with findings is scored in one batch once the document is complete
+    scored = [header for header, findings in findings_by_header.items() if findings and header not in reused]
+    with metrics.span("classify"):
+        strengths = score_sections([content_by_header[header] for header in scored])
+    for header, strength in zip(scored, strengths):
+        for finding in findings_by_header[header]:
+            finding["strength_probability"] = None if strength is None else round(strength, 4)
+    with metrics.span("precedents"):
+        precedents = find_precedents(
+            [content_by_header[header] for header in scored],
+            [[finding["matched_criterion"] for finding in findings_by_header[header]] for header in scored],
+        )
+    for header, by_criterion in zip(scored, precedents):
+        for finding in findings_by_header[header]:
+            finding["precedents"] = by_criterion[finding["matched_criterion"]]
+
+    all_findings = []
+    for findings in findings_by_header.values():
+        all_findings.extend(findings)
+    yield "findings", {"rule_based_findings": all_findings}
+
+    # TF-IDF weights depend on every letter, so similarity is only reused when no letter changed
+    letter_hashes = [section_sha(header, body) for header, body in letters]
+    letters_reused = previous_letters is not None and previous_letters[0] == letter_hashes
+    if letters_reused:
+        repetitive_letters = previous_letters[1]
+    else:
+        with metrics.span("letters"):
+            repetitive_letters = find_repetitive_letters(letters)
+    yield "letters", {"repetitive_letters": repetitive_letters}
+
+    analysis = {
+        "rule_based_findings": all_findings,
+        "repetitive_letters": repetitive_letters,
+        "rule_pack_version": pack.version,
+        "fingerprints": {"version": version, "sections": section_hashes, "letters": letter_hashes},
+    }
+    if previous is not None:
+        # Not part of the stored analysis; main.py moves it into the response
+        analysis["incremental"] = {
+            "sections_reused": len(reused),
+            "sections_rechecked": len(findings_by_header) - len(reused),
+            "letters_reused": letters_reused,
+        }
+    yield "result", ("".join(pieces), analysis)
+
+def analyze_chunks(chunks, previous=None):
+    for event, payload in analysis_events(chunks, previous):
+        if event == "result":
+            return payload
+
+def diff_findings(previous, current):
+    # What changed between two analyses of a draft: sections, findings and letter repetition
+    old_sections = previous.get("fingerprints", {}).get("sections", {})
+    new_sections = current.get("fingerprints", {}).get("sections", {})
+
+    def by_key(analysis):
+        return {(f.get("section"), f["matched_criterion"]): f for f in analysis.get("rule_based_findings", [])}
+
+    old_findings, new_findings = by_key(previous), by_key(current)
+    changed = []
+    for key, finding in new_findings.items():
+        before = old_findings.get(key)
+        if before is None:
+            continue
+        issues_added = [issue for issue in finding["issues"] if issue not in before["issues"]]
+        issues_resolved = [issue for issue in before["issues"] if issue not in finding["issues"]]
+        strength = (before.get("strength_probability"), finding.get("strength_probability"))
+        if issues_added or issues_resolved or strength[0] != strength[1]:
+            changed.append({
+                "section": key[0],
+                "matched_criterion": key[1],
+                "issues_added": issues_added,
+                "issues_resolved": issues_resolved,
+                "strength_probability": {"before": strength[0], "after": strength[1]},
+            })
+
+    def pairs(analysis):
+        return {(flag["letter_1"], flag["letter_2"]) for flag in analysis.get("repetitive_letters", [])}
+
+    old_pairs, new_pairs = pairs(previous), pairs(current)
+    return {
+        "sections": {
+            "added": [header for header in new_sections if header not in old_sections],
+            "removed": [header for header in old_sections if header not in new_sections],
+            "changed": [
+                header for header, sha in new_sections.items()
+                if header in old_sections and old_sections[header] != sha
+            ],
+        },
+        "findings": {
+            "added": [f for key, f in new_findings.items() if key not in old_findings],
+            "removed": [f for key, f in old_findings.items() if key not in new_findings],
+            "changed": changed,
+        },
+        "repetitive_letters": {
+            "added": [{"letter_1": a, "letter_2": b} for a, b in sorted(new_pairs - old_pairs)],
+            "resolved": [{"letter_1": a, "letter_2": b} for a, b in sorted(old_pairs - new_pairs)],
+        },
+    }
+
+def analyze_text(text):
+    return analyze_chunks([text])[1]
+
+def _count_pages(pages):
+    count = 0
+    for page in pages:
+        count += 1
+        yield page
+    metrics.observe("eb1a_document_pages", count)
+
+def document_chunks(data, ext):
+    metrics.observe("eb1a_document_bytes", len(data), format=ext.lstrip("."))
+    chunks = iter_document_bytes(data, ext)
+    if ext == ".pdf":
+        chunks = _count_pages(chunks)
+    return chunks
+
+def analyze_document_bytes(data, ext, previous=None):
+    # Entry point for executor workers: bytes in, extracted text and findings out
+    return analyze_chunks(document_chunks(data, ext), previous)
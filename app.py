@@ -1,6 +1,22 @@
+import json
+import time
 import streamlit as st
 import requests
 
+
+def iter_sse(response):
+    # (event, payload) pairs from a text/event-stream response
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line == "":
+            if event is not None:
+                yield event, json.loads("\n".join(data))
+            event, data = None, []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 st.set_page_config(page_title="EB1A RFE Risk Analyzer", layout="wide")
 st.title("📄 EB1A RFE Risk Analyzer")
 
@@ -10,6 +26,7 @@ if uploaded_file is not None:
     st.info(f"Analyzing: {uploaded_file.name}")
     
     API_URL = "https://eb1aanalyzer-1.onrender.com/analyze/"
+    STREAM_URL = "https://eb1aanalyzer-1.onrender.com/analyze/stream"
     uploaded_file.seek(0)
 
     try:
@@ -21,13 +38,33 @@ if uploaded_file is not None:
     with st.spinner("Processing your document..."):
         try:
             files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
-            response = requests.post(API_URL, files=files, timeout=120)
+            # Findings arrive section by section while the rest of the document is analyzed
+            response = requests.post(STREAM_URL, files=files, stream=True, timeout=(10, 120))
         except Exception as e:
             st.error(f"❌ Failed to connect to API: {e}")
             st.stop()
 
     if response.status_code == 200:
-        response_data = response.json()
+        response_data = None
+        progress = st.empty()
+        st.subheader("⏳ Live Findings")
+        for event, payload in iter_sse(response):
+            if event == "page":
+                progress.info(f"📄 Extracted page {payload['page']}")
+            elif event == "section" and payload["findings"]:
+                criteria = ", ".join(item["matched_criterion"] for item in payload["findings"])
+                st.markdown(f"- **{payload['section']}** → {criteria}")
+            elif event == "letters":
+                progress.info("🔁 Checking recommendation letters...")
+            elif event == "error":
+                st.error(f"❌ Server Error: {payload['status']} {payload['detail']}")
+                st.stop()
+            elif event == "done":
+                response_data = payload
+        progress.empty()
+        if response_data is None:
+            st.error("❌ The analysis stream ended without a result.")
+            st.stop()
 
         findings = response_data.get("rule_based_findings", [])
         repetitive_letters = response_data.get("repetitive_letters", [])
@@ -39,10 +76,16 @@ if uploaded_file is not None:
             st.success("✅ Rule-Based Analysis Results:")
             for item in findings:
                 st.markdown(f"**Criterion {item['matched_criterion']}**")
+                if item.get("strength_probability") is not None:
+                    st.markdown(f"**Evidence strength:** {item['strength_probability']:.0%}")
                 st.markdown(f"**Excerpt:**\n\n{item['excerpt']}")
                 st.markdown("**⚠️ Issues Detected:**")
                 for issue in item["issues"]:
                     st.markdown(f"- {issue}")
+                if item.get("precedents"):
+                    with st.expander(f"📚 Similar AAO decisions ({len(item['precedents'])})"):
+                        for precedent in item["precedents"]:
+                            st.markdown(f"**{precedent['source']}** ({precedent['similarity']:.0%})\n\n{precedent['excerpt']}")
                 st.markdown("---")
         else:
             st.success("✅ No rule-based issues found.")
@@ -57,7 +100,15 @@ if uploaded_file is not None:
         if pdf_report_path:
             RENDER_BASE_URL = "https://eb1aanalyzer-1.onrender.com"
             full_pdf_url = f"{RENDER_BASE_URL}/{pdf_report_path.lstrip('/')}"
+            status_url = f"{RENDER_BASE_URL}{response_data.get('report_status_url', '')}"
             try:
+                # The PDF renders in the background after the findings come back
+                with st.spinner("Rendering PDF report..."):
+                    for _ in range(60):
+                        status = requests.get(status_url, timeout=10).json().get("status")
+                        if status in ("done", "failed"):
+                            break
+                        time.sleep(1)
                 pdf_response = requests.get(full_pdf_url)
                 if pdf_response.status_code == 200:
                     st.download_button(
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analyzer import SUPPORTED_EXTENSIONS, load_document, analyze_text
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+default_input = os.path.join(base_dir, "testing_documents")
+default_output = os.path.join(base_dir, "batch_results.jsonl")
+
+
+#Discovery
+def find_documents(root):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return paths
+
+def document_key(path, root):
+    # Keys are relative to the scanned root so a results file survives moving the corpus
+    return os.path.relpath(path, root)
+
+
+#Resume Support
+def load_completed(output_path):
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted run; the document is simply re-analyzed
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["document"])
+    return completed
+
+def open_output(output_path, restart):
+    if not restart and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    return open(output_path, "w" if restart else "a", encoding="utf-8")
+
+
+#Worker
+def analyze_file(path, key):
+    started = time.perf_counter()
+    record = {"document": key, "path": path, "bytes": os.path.getsize(path)}
+    try:
+        text = load_document(path)
+        analysis = analyze_text(text)
+        record.update(status="ok", characters=len(text), **analysis)
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["elapsed_seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+#Entry Point
+def run_batch(root, output_path, workers=None, restart=False):
+    documents = find_documents(root)
+    completed = set() if restart else load_completed(output_path)
+    pending = [(path, document_key(path, root)) for path in documents]
+    pending = [(path, key) for path, key in pending if key not in completed]
+
+    print(f"📂 {len(documents)} documents under {root}, {len(completed)} already done, {len(pending)} to analyze")
+    if not pending:
+        return 0
+
+    failures = 0
+    with open_output(output_path, restart) as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_file, path, key): key for path, key in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+            if record["status"] == "ok":
+                print(f"✅ [{done}/{len(pending)}] {record['document']} — "
+                      f"{len(record['rule_based_findings'])} findings ({record['elapsed_seconds']:.2f}s)")
+            else:
+                failures += 1
+                print(f"❌ [{done}/{len(pending)}] {record['document']} — {record['error']}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze every petition under a directory tree in parallel.")
+    parser.add_argument("root", nargs="?", default=default_input, help="directory to scan recursively")
+    parser.add_argument("-o", "--output", default=default_output, help="JSONL file, one result per document")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--restart", action="store_true", help="ignore previous results and start over")
+    args = parser.parse_args(argv)
+
+    failures = run_batch(args.root, args.output, args.workers, args.restart)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
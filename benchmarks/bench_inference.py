@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import argparse
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from analyzer import load_document, segment_by_criterion, apply_advanced_rule_based_check
+from classifier import get_classifier, predict_strength
+
+
+corpus_folders = ("test_petitions", "testing_documents")
+
+
+#Reference Implementation
+# One transform and predict_proba call per section, as a naive integration would do
+def score_one_by_one(sections):
+    return [predict_strength([section])[0] for section in sections]
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round((len(sorted_values) - 1) * q)))]
+
+def load_petitions(folders):
+    # Sections of each document that the analyzer would score (those with rule findings)
+    petitions = []
+    for folder in folders:
+        path = os.path.join(base_dir, folder)
+        for filename in sorted(os.listdir(path)):
+            try:
+                text = load_document(os.path.join(path, filename))
+            except Exception as e:
+                print(f"⚠️ Skipping {filename}: {e}")
+                continue
+            sections = [body for body in segment_by_criterion(text).values() if apply_advanced_rule_based_check(body)]
+            if not sections:
+                # AAO decisions rarely use "Criterion N:" headers; score the whole text instead
+                sections = [text]
+            petitions.append((filename, sections))
+    return petitions
+
+def time_per_petition(score, petitions, repeat):
+    samples = []
+    for _ in range(repeat):
+        for _, sections in petitions:
+            started = time.perf_counter()
+            score(sections)
+            samples.append(time.perf_counter() - started)
+    return sorted(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time batched classifier scoring of petition sections.")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over every petition")
+    parser.add_argument("--budget-ms", type=float, default=20.0, help="allowed p50 added per petition")
+    args = parser.parse_args(argv)
+
+    artifact = get_classifier()
+    petitions = load_petitions(corpus_folders)
+    sections = sum(len(s) for _, s in petitions)
+
+    mismatches = [
+        name for name, s in petitions
+        if any(abs(a - b) > 1e-9 for a, b in zip(score_one_by_one(s), predict_strength(s)))
+    ]
+    if mismatches:
+        print(f"❌ Batched scores differ for {', '.join(mismatches)}")
+        raise SystemExit(1)
+
+    # Warm up both paths once before timing
+    for _, s in petitions:
+        predict_strength(s)
+        score_one_by_one(s)
+
+    single = time_per_petition(score_one_by_one, petitions, args.repeat)
+    batched = time_per_petition(predict_strength, petitions, args.repeat)
+
+    print(f"🤖 {artifact['model_version']}: {len(petitions)} petitions, {sections} sections — scores identical")
+    for label, samples in (("one call per section", single), ("one batched call", batched)):
+        print(f"⏱️ {label:22s} p50={percentile(samples, 0.5) * 1000:7.2f} ms  p95={percentile(samples, 0.95) * 1000:7.2f} ms")
+
+    p50 = percentile(batched, 0.5) * 1000
+    if p50 > args.budget_ms:
+        print(f"❌ Batched inference adds {p50:.2f} ms per petition (budget {args.budget_ms:.0f} ms)")
+        raise SystemExit(1)
+    print(f"✅ Batched inference adds {p50:.2f} ms per petition (budget {args.budget_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
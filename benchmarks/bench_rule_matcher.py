@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import argparse
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from analyzer import (
+    normalize, load_document, segment_by_criterion, apply_advanced_rule_based_check,
+)
+from rule_packs import active_pack
+
+
+#Reference Implementation
+# The per-keyword substring scan that apply_advanced_rule_based_check used before the
+# rules were compiled into one automaton; kept here to prove the outputs are identical.
+def legacy_rule_based_check(section_text):
+    results = []
+    cleaned = normalize(section_text)
+    pack = active_pack()
+    for criterion, rule in pack.rules.items():
+        if any(k in cleaned for k in rule["keywords"]):
+            issues = []
+            for phrase, message in rule["red_flags"]:
+                if phrase in cleaned:
+                    issues.append(message)
+            expected = pack.expectations.get(criterion, [])
+            issues += [f"Missing expected detail: {keyword}" for keyword in expected if keyword.lower() not in cleaned]
+            results.append({
+                "matched_criterion": criterion,
+                "issues": issues or ["None detected"],
+                "excerpt": section_text[:300] + "..." if len(section_text) > 300 else section_text
+            })
+    return results
+
+
+def load_sections(folder):
+    sections = []
+    for filename in sorted(os.listdir(folder)):
+        try:
+            text = load_document(os.path.join(folder, filename))
+        except Exception as e:
+            print(f"⚠️ Skipping {filename}: {e}")
+            continue
+        # AAO decisions rarely use "Criterion N:" headers, so the whole text is checked too
+        sections.append(text)
+        sections.extend(segment_by_criterion(text).values())
+    return sections
+
+def time_check(check, sections, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for section in sections:
+            check(section)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the compiled rule matcher with the per-keyword scan.")
+    parser.add_argument("folder", nargs="?", default=os.path.join(base_dir, "testing_documents"))
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes; the fastest one is reported")
+    args = parser.parse_args(argv)
+
+    sections = load_sections(args.folder)
+    characters = sum(len(s) for s in sections)
+
+    mismatches = [i for i, s in enumerate(sections) if legacy_rule_based_check(s) != apply_advanced_rule_based_check(s)]
+    if mismatches:
+        print(f"❌ {len(mismatches)} sections produced different findings")
+        raise SystemExit(1)
+
+    legacy = time_check(legacy_rule_based_check, sections, args.repeat)
+    compiled = time_check(apply_advanced_rule_based_check, sections, args.repeat)
+
+    print(f"📄 {len(sections)} sections, {characters / 1e6:.2f}M characters — findings identical")
+    print(f"🐢 substring scan : {legacy * 1000:8.1f} ms  ({characters / legacy / 1e6:6.1f} M chars/s)")
+    print(f"⚡ compiled rules : {compiled * 1000:8.1f} ms  ({characters / compiled / 1e6:6.1f} M chars/s)")
+    print(f"🚀 speedup        : {legacy / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from analyzer import load_document, segment_document, DocumentSegmenter
+
+
+corpus_folders = ("testing_documents", "test_petitions", "recommendation_letters")
+page_characters = 3000
+
+
+#Reference Implementation
+# segment_by_criterion and extract_recommendation_letters before the single-pass
+# segmenter: one re.split per kind, each with a pattern compiled at call time.
+def legacy_segments(text):
+    segments = {}
+    for kind, pattern in (
+        ("criterion", r"(Criterion\s+\d+\s*[:\-–]\s*[^\n]*)"),
+        ("letter", r"(Letter\s+from\s+[^\n]+|Recommendation\s+Letter\s+from\s+[^\n]+)"),
+    ):
+        parts = re.split(pattern, text, flags=re.IGNORECASE)
+        segments[kind] = [
+            (parts[i].strip(), parts[i + 1].strip() if i + 1 < len(parts) else "") for i in range(1, len(parts), 2)
+        ]
+    return segments
+
+
+def single_pass(text):
+    return {kind: [tuple(section) for section in sections] for kind, sections in segment_document(text).items()}
+
+def streamed(text):
+    # Fed one page-sized chunk at a time, as the /analyze/ pipeline does
+    segmenter = DocumentSegmenter()
+    sections = []
+    for start in range(0, len(text), page_characters):
+        sections.extend(segmenter.feed(text[start:start + page_characters]))
+    sections.extend(segmenter.close())
+    return {kind: [(header, body) for k, header, body in sections if k == kind] for kind in ("criterion", "letter")}
+
+def load_bundles(folders):
+    # Every document in a folder joined into one text, like a full filing
+    bundles = []
+    for folder in folders:
+        texts = []
+        path = os.path.join(base_dir, folder)
+        for filename in sorted(os.listdir(path)):
+            try:
+                texts.append(load_document(os.path.join(path, filename)))
+            except Exception as e:
+                print(f"⚠️ Skipping {filename}: {e}")
+        if texts:
+            bundles.append((folder, "\n\n".join(texts)))
+    return bundles
+
+def time_segmenter(segment, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        segment(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the single-pass segmenter with one re.split per header kind.")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes; the fastest one is reported")
+    parser.add_argument("--copies", type=int, default=10, help="repeat each bundle this many times to enlarge it")
+    args = parser.parse_args(argv)
+
+    bundles = [(name, "\n\n".join([text] * args.copies)) for name, text in load_bundles(corpus_folders)]
+    for name, text in bundles:
+        expected = legacy_segments(text)
+        if single_pass(text) != expected or streamed(text) != expected:
+            print(f"❌ {name}: sections differ from the re.split segmentation")
+            raise SystemExit(1)
+
+    for name, text in bundles:
+        counts = {kind: len(sections) for kind, sections in legacy_segments(text).items()}
+        legacy = time_segmenter(legacy_segments, text, args.repeat)
+        views = time_segmenter(segment_document, text, args.repeat)
+        copied = time_segmenter(single_pass, text, args.repeat)
+        stream = time_segmenter(streamed, text, args.repeat)
+        print(f"📄 {name}: {len(text) / 1e6:.2f}M characters, {counts['criterion']} criteria, {counts['letter']} letters — sections identical")
+        print(f"🐢 two re.split      : {legacy * 1000:8.1f} ms")
+        print(f"⚡ single pass views : {views * 1000:8.1f} ms  ({legacy / views:.2f}x)")
+        print(f"📋 views read        : {copied * 1000:8.1f} ms  ({legacy / copied:.2f}x)")
+        print(f"🌊 streamed by page  : {stream * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
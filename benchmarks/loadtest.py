@@ -0,0 +1,478 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+default_folders = ("testing_documents", "test_petitions")
+default_mix = "analyze=8,report=2"
+default_output = os.path.join(base_dir, "loadtest_results.json")
+# The server only reads the precedent index, so the real one is searched, as in production
+default_precedent_index = os.environ.get("EB1A_PRECEDENT_INDEX_DIR", os.path.join(base_dir, "precedent_index"))
+probe_interval = 0.1
+
+
+#Documents
+def parse_weights(spec, known=None):
+    # "a=3,b=1" -> {"a": 3.0, "b": 1.0}; a bare name weighs 1
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if known is not None and name not in known:
+            raise SystemExit(f"Unknown name {name!r}; expected one of {', '.join(known)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def load_corpus(folder_weights):
+    # [(folder, filename, bytes, weight per document)]; every folder gets its share of the
+    # traffic however many documents it holds
+    corpus = []
+    for folder, weight in folder_weights.items():
+        path = os.path.join(base_dir, folder)
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith((".pdf", ".docx", ".txt")))
+        for name in names:
+            with open(os.path.join(path, name), "rb") as f:
+                corpus.append((folder, name, f.read(), weight / len(names)))
+    if not corpus:
+        raise SystemExit("No documents to upload")
+    return corpus
+
+def fresh_copy(name, data, token):
+    # Different bytes, same extracted text, so the upload misses the result cache
+    if name.lower().endswith(".pdf"):
+        return data + f"\n%loadtest {token}\n".encode()
+    if name.lower().endswith(".docx"):
+        buffer = io.BytesIO(data)
+        with zipfile.ZipFile(buffer, "a") as archive:
+            archive.comment = f"loadtest {token}".encode()
+        return buffer.getvalue()
+    return data + f"\n{token}\n".encode()
+
+
+#Server
+def start_server(kind, port, workers, scratch, precedent_index=None):
+    # precedent_index: directory of the index findings are matched against; None for an empty one
+    env = dict(os.environ, PORT=str(port), EB1A_WEB_WORKERS=str(workers))
+    env["EB1A_PRECEDENT_INDEX_DIR"] = precedent_index or os.path.join(scratch, "eb1a_precedent_index_dir")
+    # Keep every artifact the server writes out of the working tree
+    for name in ("EB1A_REPORTS_DIR", "EB1A_CACHE_DIR", "EB1A_LETTER_INDEX_DIR"):
+        env.setdefault(name, os.path.join(scratch, name.lower()))
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    log_path = os.path.join(scratch, "server.log")
+    log = open(log_path, "wb")
+    process = subprocess.Popen(command, cwd=base_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, log_path
+
+def wait_until_ready(url, process, log_path, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            break
+        try:
+            if httpx.get(f"{url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    if log_path:
+        with open(log_path, "r", errors="replace") as f:
+            print(f.read()[-3000:])
+    raise SystemExit(f"❌ Server at {url} did not come up within {timeout:.0f}s")
+
+def stop_server(process):
+    if process is None or process.poll() is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+#Memory
+def _process_tree(root):
+    # [(pid, depth)] for root and all its descendants: gunicorn workers, and the analysis
+    # and report render processes they start
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may itself contain spaces
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [(root, 0)]
+    while stack:
+        pid, depth = stack.pop()
+        tree.append((pid, depth))
+        stack.extend((child, depth + 1) for child in children.get(pid, ()))
+    return tree
+
+def _memory_kib(pid):
+    # (RSS, PSS) in KiB. PSS divides pages shared copy-on-write between the processes that
+    # map them, so summed over the workers it is the real footprint of a preloaded server.
+    rss = pss = None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+def _role(depth, server):
+    if server == "gunicorn":
+        return ("master", "worker")[depth] if depth < 2 else "child"
+    return "server" if depth == 0 else "child"
+
+
+class Recorder:
+    # Every request outcome plus a timeline sampled every `interval` seconds: requests
+    # finished so far, requests in flight and the memory of each server process.
+
+    def __init__(self, server_pid, server, interval):
+        self.server_pid = server_pid
+        self.server = server
+        self.interval = interval
+        self.samples = {}
+        self.timeline = []
+        self.in_flight = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def record(self, endpoint, seconds, status, error=None):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((seconds, status, error))
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _sample(self):
+        with self._lock:
+            point = {
+                "t": round(time.monotonic() - self.started, 2),
+                "completed": sum(len(samples) for endpoint, samples in self.samples.items() if endpoint != "probe"),
+                "in_flight": self.in_flight,
+            }
+        if self.server_pid is not None and os.path.isdir("/proc"):
+            processes = {}
+            for pid, depth in _process_tree(self.server_pid):
+                rss, pss = _memory_kib(pid)
+                if rss is None:
+                    continue
+                processes[str(pid)] = {
+                    "role": _role(depth, self.server),
+                    "rss_mb": round(rss / 1024, 1),
+                    "pss_mb": None if pss is None else round(pss / 1024, 1),
+                }
+            point["processes"] = processes
+        self.timeline.append(point)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+#Operations
+class Client:
+    def __init__(self, url, corpus, fresh, report_format, recorder, timeout):
+        self.url = url
+        self.corpus = corpus
+        self.weights = [weight for _, _, _, weight in corpus]
+        self.fresh = fresh
+        self.report_format = report_format
+        self.recorder = recorder
+        self.timeout = timeout
+        self.reports = []
+        self._reports_lock = threading.Lock()
+        self._local = threading.local()
+        self._uploads = 0
+
+    def _http(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = httpx.Client(base_url=self.url, timeout=self.timeout)
+        return client
+
+    def _request(self, endpoint, method, path, scheduled=None, **kwargs):
+        # Latency runs from the scheduled send time when there is one, so requests that had
+        # to wait for a free client thread are not reported as fast
+        started = time.perf_counter() if scheduled is None else scheduled
+        try:
+            response = self._http().request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(endpoint, time.perf_counter() - started, None, type(e).__name__)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    def analyze(self, scheduled=None):
+        folder, name, data, _ = random.choices(self.corpus, self.weights)[0]
+        if random.random() < self.fresh:
+            with self._reports_lock:
+                self._uploads += 1
+                token = f"{os.getpid()}-{self._uploads}"
+            data = fresh_copy(name, data, token)
+        response = self._request(
+            "analyze", "POST", "/analyze/", scheduled,
+            params={"report_format": self.report_format}, files={"file": (name, data)},
+        )
+        if response is not None and response.status_code == 200:
+            report_id = response.json().get("report_id")
+            if report_id:
+                with self._reports_lock:
+                    self.reports.append(report_id)
+                    del self.reports[:-256]
+
+    def report(self, scheduled=None):
+        # Status poll and download of a report some earlier analysis queued; PDFs still
+        # rendering answer 202, which counts as a success
+        with self._reports_lock:
+            report_id = random.choice(self.reports) if self.reports else None
+        if report_id is None:
+            return self.analyze(scheduled)
+        if self.report_format == "pdf":
+            self._request("report_status", "GET", f"/reports/{report_id}/status", scheduled)
+            self._request("report_download", "GET", f"/reports/{report_id}")
+        else:
+            self._request("report_download", "GET", f"/reports/{report_id}.{self.report_format}", scheduled)
+
+    def run(self, operation, scheduled=None):
+        self.recorder.begin()
+        try:
+            getattr(self, operation)(scheduled)
+        finally:
+            self.recorder.end()
+
+
+def probe(url, recorder, stop):
+    # GET / does no work, so slow answers mean the event loop was busy with something else
+    with httpx.Client(base_url=url, timeout=30) as client:
+        while not stop.wait(probe_interval):
+            started = time.perf_counter()
+            try:
+                status = client.get("/").status_code
+                recorder.record("probe", time.perf_counter() - started, status)
+            except httpx.HTTPError as e:
+                recorder.record("probe", time.perf_counter() - started, None, type(e).__name__)
+
+
+#Load Shapes
+def closed_loop(client, mix, concurrency, duration):
+    # Fixed number of users, each sending its next request as soon as the last one returns
+    deadline = time.monotonic() + duration
+    operations, weights = list(mix), list(mix.values())
+
+    def user():
+        while time.monotonic() < deadline:
+            client.run(random.choices(operations, weights)[0])
+
+    threads = [threading.Thread(target=user) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def open_loop(client, mix, rate, duration, arrivals, max_in_flight):
+    # Requests arrive on a schedule whether or not earlier ones have finished, like real
+    # traffic; past max_in_flight they wait for a client thread and the wait counts
+    operations, weights = list(mix), list(mix.values())
+    started = time.perf_counter()
+    next_at = started
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(client.run, random.choices(operations, weights)[0], next_at)
+            next_at += random.expovariate(rate) if arrivals == "poisson" else 1 / rate
+
+
+#Report
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(samples, elapsed):
+    latencies = sorted(seconds for seconds, _, _ in samples)
+    statuses = {}
+    for _, status, error in samples:
+        key = error or str(status)
+        statuses[key] = statuses.get(key, 0) + 1
+    failed = sum(1 for _, status, error in samples if error or status >= 400)
+    return {
+        "requests": len(samples),
+        "throughput_per_s": round(len(samples) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+
+def memory_summary(timeline):
+    processes = {}
+    for point in timeline:
+        for pid, usage in point.get("processes", {}).items():
+            entry = processes.setdefault(pid, {"role": usage["role"], "start_rss_mb": usage["rss_mb"], "peak_rss_mb": 0.0})
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], usage["rss_mb"])
+            entry["end_rss_mb"] = usage["rss_mb"]
+            if usage["pss_mb"] is not None:
+                entry["peak_pss_mb"] = max(entry.get("peak_pss_mb", 0.0), usage["pss_mb"])
+    totals = [
+        sum(usage["pss_mb"] or usage["rss_mb"] for usage in point["processes"].values())
+        for point in timeline if point.get("processes")
+    ]
+    return {"processes": processes, "peak_total_pss_mb": round(max(totals), 1) if totals else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive /analyze/ and the report endpoints and report capacity.")
+    shape = parser.add_mutually_exclusive_group()
+    shape.add_argument("--concurrency", type=int, default=4, help="closed loop: users sending back to back")
+    shape.add_argument("--rate", type=float, help="open loop: requests per second, whatever the response times")
+    parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson", help="open-loop spacing")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open loop: client threads")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--mix", default=default_mix, help="operation weights: analyze, report")
+    parser.add_argument("--folders", default=",".join(default_folders),
+                        help="document folders and their share of uploads, e.g. testing_documents=3,test_petitions=1")
+    parser.add_argument("--fresh", type=float, default=1.0,
+                        help="share of uploads altered to miss the result cache (0 = every repeat is cached)")
+    parser.add_argument("--report-format", choices=("pdf", "html", "json"), default="pdf")
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --url: sample this process tree's memory")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="gunicorn",
+                        help="server to start (or, with --url, the one running)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (EB1A_WEB_WORKERS)")
+    parser.add_argument("--precedent-index", default=default_precedent_index,
+                        help='precedent index the server searches (read only); "" for an empty one')
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout in seconds")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between memory samples")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("-o", "--output", default=default_output, help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    mix = parse_weights(args.mix, known=("analyze", "report"))
+    corpus = load_corpus(parse_weights(args.folders))
+
+    if args.precedent_index and not os.path.isdir(args.precedent_index):
+        print(f"⚠️ No precedent index at {args.precedent_index}; precedent search will cost nothing. "
+              "Build one with `python precedent_index.py add <decisions>`.")
+    scratch = tempfile.mkdtemp(prefix="eb1a-loadtest-")
+    process = log_path = None
+    url, server_pid = args.url, args.server_pid
+    try:
+        if url is None:
+            process, log_path = start_server(args.server, args.port, args.workers, scratch, args.precedent_index)
+            url, server_pid = f"http://127.0.0.1:{args.port}", process.pid
+        url = url.rstrip("/")
+        wait_until_ready(url, process, log_path, args.startup_timeout)
+        load = f"{args.rate:g} req/s ({args.arrivals})" if args.rate else f"{args.concurrency} concurrent users"
+        print(f"🚦 {load} for {args.duration:g}s against {url}: {len(corpus)} documents, mix {args.mix}")
+
+        recorder = Recorder(server_pid, args.server, args.sample_interval)
+        client = Client(url, corpus, args.fresh, args.report_format, recorder, args.timeout)
+        stop_probe = threading.Event()
+        prober = threading.Thread(target=probe, args=(url, recorder, stop_probe), daemon=True)
+        recorder.start()
+        prober.start()
+        started = time.perf_counter()
+        if args.rate:
+            open_loop(client, mix, args.rate, args.duration, args.arrivals, args.max_in_flight)
+        else:
+            closed_loop(client, mix, args.concurrency, args.duration)
+        elapsed = time.perf_counter() - started
+        stop_probe.set()
+        prober.join()
+        recorder.stop()
+    finally:
+        stop_server(process)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    endpoints = {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(recorder.samples.items())}
+    memory = memory_summary(recorder.timeline)
+    results = {
+        "url": url,
+        "load": {"concurrency": None if args.rate else args.concurrency, "rate": args.rate, "arrivals": args.arrivals,
+                 "duration_s": round(elapsed, 1), "mix": mix, "fresh": args.fresh, "report_format": args.report_format,
+                 "server": args.server, "workers": args.workers if not args.url else None,
+                 "precedent_index": (args.precedent_index or None) if not args.url else None},
+        "endpoints": endpoints,
+        "memory": memory,
+        "timeline": recorder.timeline,
+    }
+
+    print(f"\n{'endpoint':16s} {'n':>6s} {'req/s':>8s} {'err':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}  statuses")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:16s} {stats['requests']:6d} {stats['throughput_per_s']:8.2f} {stats['error_rate']:6.1%} "
+              f"{stats['p50_ms']:7.0f}ms {stats['p95_ms']:7.0f}ms {stats['p99_ms']:7.0f}ms {stats['max_ms']:7.0f}ms  "
+              f"{stats['statuses']}")
+    if "probe" in endpoints and endpoints["probe"]["p99_ms"] > 100:
+        print(f"⚠️ GET / took {endpoints['probe']['p99_ms']:.0f} ms at p99 — something is blocking the event loop")
+    for pid, usage in memory["processes"].items():
+        pss = f", peak PSS {usage['peak_pss_mb']:.0f} MB" if "peak_pss_mb" in usage else ""
+        print(f"🧠 {usage['role']:7s} {pid:>7s}: RSS {usage['start_rss_mb']:.0f} → {usage['end_rss_mb']:.0f} MB "
+              f"(peak {usage['peak_rss_mb']:.0f} MB{pss})")
+    if memory["peak_total_pss_mb"] is not None:
+        print(f"🧠 whole server peak: {memory['peak_total_pss_mb']:.0f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+# Keep every artifact the server writes out of the working tree; these are read at import
+_scratch = tempfile.mkdtemp(prefix="eb1a-bench-")
+for _name in ("EB1A_REPORTS_DIR", "EB1A_CACHE_DIR", "EB1A_LETTER_INDEX_DIR"):
+    os.environ.setdefault(_name, os.path.join(_scratch, _name.lower()))
+
+from analyzer import (
+    load_document, segment_by_criterion, segment_document, apply_advanced_rule_based_check, detect_repetitive_letters,
+    analyze_text, letters_or_whole_document, score_sections,
+)
+from report_generator import generate_pdf_report, generate_report
+
+
+corpus_folders = ("testing_documents", "test_petitions", "recommendation_letters")
+default_output = os.path.join(base_dir, "bench_results.json")
+
+
+#Measurement
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def summarize(samples, work_bytes):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 0.90) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "mean_ms": round(total / len(ordered) * 1000, 3) if ordered else 0.0,
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "throughput_per_s": round(len(ordered) / total, 3) if total else 0.0,
+        "mb_per_s": round(work_bytes / total / 1e6, 3) if total else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def run_stage(name, func, items, repeat, warmup=1):
+    # items: [(args, size_in_bytes)]; every item runs `warmup` untimed times, then `repeat` timed ones
+    for args, _ in items:
+        for _ in range(warmup):
+            func(*args)
+    samples, work_bytes = [], 0
+    for _ in range(repeat):
+        for args, size in items:
+            started = time.perf_counter()
+            func(*args)
+            samples.append(time.perf_counter() - started)
+            work_bytes += size
+    stats = summarize(samples, work_bytes)
+    print(f"⏱️ {name:32s} n={stats['count']:<5d} p50={stats['p50_ms']:9.2f} ms  "
+          f"p95={stats['p95_ms']:9.2f} ms  {stats['throughput_per_s']:8.1f}/s  rss={stats['peak_rss_mb']:.0f} MB")
+    return stats
+
+
+#Corpus
+def collect_documents(folders, limit=None):
+    documents = []
+    for folder in folders:
+        path = os.path.join(base_dir, folder)
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith((".pdf", ".docx", ".txt")))
+        documents.extend(os.path.join(path, name) for name in names[:limit])
+    return documents
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=base_dir, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+#Stages
+def benchmark_pipeline(documents, repeat, pdf_samples):
+    stages = {}
+    stages["load_document"] = run_stage(
+        "load_document", load_document, [((path,), os.path.getsize(path)) for path in documents], repeat
+    )
+
+    texts = [(os.path.basename(path), load_document(path)) for path in documents]
+    stages["segment_by_criterion"] = run_stage(
+        "segment_by_criterion", segment_by_criterion, [((text,), len(text)) for _, text in texts], repeat
+    )
+    stages["segment_document"] = run_stage(
+        "segment_document", segment_document, [((text,), len(text)) for _, text in texts], repeat
+    )
+
+    # AAO decisions rarely use "Criterion N:" headers, so whole documents are checked as well
+    sections = [text for _, text in texts]
+    for _, text in texts:
+        sections.extend(segment_by_criterion(text).values())
+    stages["apply_advanced_rule_based_check"] = run_stage(
+        "apply_advanced_rule_based_check", apply_advanced_rule_based_check,
+        [((section,), len(section)) for section in sections], repeat
+    )
+
+    # One batched classifier call per document, over the sections that have findings
+    section_sets = [
+        [body for body in segment_by_criterion(text).values() if apply_advanced_rule_based_check(body)] or [text]
+        for _, text in texts
+    ]
+    stages["score_sections"] = run_stage(
+        "score_sections", score_sections, [((batch,), sum(map(len, batch))) for batch in section_sets], repeat
+    )
+
+    letter_sets = [letters_or_whole_document(text, name) for name, text in texts]
+    letter_sets.append([letter for letters in letter_sets for letter in letters])
+    stages["detect_repetitive_letters"] = run_stage(
+        "detect_repetitive_letters", detect_repetitive_letters,
+        [((letters,), sum(len(body) for _, body in letters)) for letters in letter_sets if len(letters) > 1], repeat
+    )
+
+    analyses = [analyze_text(text) for _, text in texts[:pdf_samples]]
+    stages["generate_html_report"] = run_stage(
+        "generate_html_report", lambda analysis: generate_report(analysis, "benchmark", "html"),
+        [((analysis,), 0) for analysis in analyses], repeat
+    )
+    stages["generate_pdf_report"] = run_stage(
+        "generate_pdf_report", lambda analysis: generate_pdf_report(analysis, "benchmark"),
+        [((analysis,), 0) for analysis in analyses], max(1, repeat // 2)
+    )
+    return stages
+
+def benchmark_endpoint(documents, repeat):
+    from fastapi.testclient import TestClient
+    import main
+
+    payloads = []
+    for path in documents:
+        with open(path, "rb") as f:
+            payloads.append((os.path.basename(path), f.read()))
+
+    def post(name, data):
+        response = client.post("/analyze/", files={"file": (name, data)})
+        if response.status_code != 200:
+            raise RuntimeError(f"/analyze/ returned {response.status_code} for {name}: {response.text[:200]}")
+
+    stages = {}
+    with TestClient(main.app) as client:
+        # First upload of each document misses the result cache; repeats hit it
+        stages["analyze_endpoint_cold"] = run_stage(
+            "analyze_endpoint_cold", post, [((name, data), len(data)) for name, data in payloads], 1, warmup=0
+        )
+        stages["analyze_endpoint_cached"] = run_stage(
+            "analyze_endpoint_cached", post, [((name, data), len(data)) for name, data in payloads], repeat, warmup=0
+        )
+    return stages
+
+
+#Baseline Comparison
+def compare(current, baseline, tolerance):
+    regressions = []
+    print(f"\n{'stage':34s} {'p50 base':>10s} {'p50 now':>10s} {'p95 base':>10s} {'p95 now':>10s}")
+    for name, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            print(f"{name:34s} {'—':>10s} {stats['p50_ms']:10.2f} {'—':>10s} {stats['p95_ms']:10.2f}  (new)")
+            continue
+        flags = [
+            metric for metric in ("p50_ms", "p95_ms")
+            if base[metric] > 0 and stats[metric] > base[metric] * (1 + tolerance)
+        ]
+        marker = "  ❌ regression" if flags else ""
+        print(f"{name:34s} {base['p50_ms']:10.2f} {stats['p50_ms']:10.2f} "
+              f"{base['p95_ms']:10.2f} {stats['p95_ms']:10.2f}{marker}")
+        if flags:
+            regressions.append({"stage": name, "metrics": flags})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each analyzer stage over the bundled documents.")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over every item")
+    parser.add_argument("--limit", type=int, default=None, help="documents per folder (default: all)")
+    parser.add_argument("--pdf-samples", type=int, default=5, help="analyses rendered by generate_pdf_report")
+    parser.add_argument("--skip-endpoint", action="store_true", help="do not time /analyze/ end to end")
+    parser.add_argument("-o", "--output", default=default_output, help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved results file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before flagging (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    documents = collect_documents(corpus_folders, args.limit)
+    print(f"📂 {len(documents)} documents from {', '.join(corpus_folders)}")
+
+    try:
+        results = {"environment": environment(), "documents": len(documents), "repeat": args.repeat}
+        results["stages"] = benchmark_pipeline(documents, args.repeat, args.pdf_samples)
+        if not args.skip_endpoint:
+            results["stages"].update(benchmark_endpoint(documents, args.repeat))
+    finally:
+        shutil.rmtree(_scratch, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+            raise SystemExit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
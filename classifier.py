@@ -0,0 +1,457 @@
+import os
+import json
+import random
+import time
+import hashlib
+import argparse
+import datetime
+import tempfile
+import threading
+
+from collections import Counter
+
+import joblib
+import sklearn
+
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import train_test_split, GridSearchCV, HalvingGridSearchCV
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.utils import resample
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+training_json_path = os.path.join(base_dir, "training_data.json")
+model_dir = os.environ.get("EB1A_MODEL_DIR", os.path.join(base_dir, "models"))
+manifest_name = "eb1a_classifier.json"
+# Vectorized train/test splits, reused while the labeled data is unchanged
+feature_cache_dir = os.path.join(model_dir, "feature_cache")
+# How often a running server checks the manifest for a newly trained model (0 = never)
+model_watch_seconds = float(os.environ.get("EB1A_MODEL_WATCH_SECONDS", "5"))
+
+# Bump when the layout of the pickled artifact changes
+ARTIFACT_FORMAT_VERSION = 1
+
+
+class ModelArtifactError(RuntimeError):
+    pass
+
+
+#Training Data
+def hash_training_data(path=training_json_path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_training_data(path=training_json_path):
+    with open(path, "r") as f:
+        data = [json.loads(line) for line in f if line.strip()]
+    x = [entry["excerpt"] for entry in data]
+    y = [1 if entry["issue_flag"] == "Strong Evidence" else 0 for entry in data]
+    return x, y
+
+
+#Training
+vectorizer_params = {"ngram_range": (1, 2), "max_features": 1000}
+
+# predict_proba walks every tree, about 0.12 ms each per petition here; more than 64 trees
+# would not fit the 20 ms scoring budget checked by benchmarks/bench_inference.py
+max_trees = 64
+
+param_grid = {
+    'n_estimators': [max_trees // 2, max_trees],
+    'max_depth': [None, 10],
+    'min_samples_split': [2, 5],
+    'min_samples_leaf': [1, 2]
+}
+
+# Successive halving grows the forest instead of the sample count: the labeled set is small,
+# while trees are what every candidate pays for. 8 candidates → 4 → 2 → 1 at max_trees.
+halving_min_trees = max_trees // 8
+halving_max_trees = max_trees
+
+
+def _split(x, y, balance, random_state):
+    if balance == "upsample":
+        # Combine and balance the dataset
+        combined = list(zip(x, y))
+        majority = [pair for pair in combined if pair[1] == 0]
+        minority = [pair for pair in combined if pair[1] == 1]
+
+        minority_upsampled = resample(minority, replace=True, n_samples=len(majority), random_state=random_state)
+        balanced = majority + minority_upsampled
+        random.Random(random_state).shuffle(balanced)
+
+        x, y = zip(*balanced)
+        return train_test_split(x, y, random_state=random_state, test_size=0.2)
+
+    # Class weights balance the loss instead, so the split keeps the real class ratio
+    stratify = y if min(Counter(y).values()) >= 2 else None
+    return train_test_split(x, y, random_state=random_state, test_size=0.2, stratify=stratify)
+
+def build_features(x, y, balance="class_weight", random_state=42, cache_dir=feature_cache_dir):
+    # The split and fitted TfidfVectorizer depend only on the data and these settings, so
+    # they are computed once and reused by every later run until training_data.json changes
+    key = hashlib.sha256(
+        json.dumps([x, y, vectorizer_params, balance, random_state], default=str).encode("utf-8")
+    ).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"features-{key}.joblib") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        return joblib.load(cache_path)
+
+    x_train, x_test, y_train, y_test = _split(x, y, balance, random_state)
+
+    # Vectorize text
+    vect = TfidfVectorizer(**vectorizer_params)
+    features = {
+        "vectorizer": vect,
+        "x_train": vect.fit_transform(x_train),
+        "x_test": vect.transform(x_test),
+        "y_train": list(y_train),
+        "y_test": list(y_test),
+    }
+    if cache_path:
+        _atomic_write(cache_path, lambda f: joblib.dump(features, f))
+    return features
+
+def train_classifier(x, y, random_state=42, verbose=2, search="halving", balance="class_weight",
+                     n_jobs=-1, cache_dir=feature_cache_dir):
+    # search="grid", balance="upsample", n_jobs=1 reproduces the original exhaustive training
+    started = time.perf_counter()
+    features = build_features(x, y, balance, random_state, cache_dir)
+    vect = features["vectorizer"]
+    x_train_vect, x_test_vect = features["x_train"], features["x_test"]
+    y_train, y_test = features["y_train"], features["y_test"]
+
+    # Search runs folds and candidates in parallel; each forest stays single-threaded
+    clf = RandomForestClassifier(
+        random_state=random_state, class_weight="balanced" if balance == "class_weight" else None
+    )
+    if search == "halving":
+        grid = HalvingGridSearchCV(
+            clf, {k: v for k, v in param_grid.items() if k != 'n_estimators'},
+            resource='n_estimators', min_resources=halving_min_trees, max_resources=halving_max_trees,
+            factor=2, scoring='f1_macro', cv=5, n_jobs=n_jobs, random_state=random_state, verbose=verbose,
+        )
+    elif search == "grid":
+        grid = GridSearchCV(clf, param_grid, scoring='f1_macro', cv=5, n_jobs=n_jobs, verbose=verbose)
+    else:
+        raise ValueError(f"search must be 'halving' or 'grid', not {search!r}")
+    grid.fit(x_train_vect, y_train)
+
+    # Evaluate
+    best_model = grid.best_estimator_
+    y_pred = best_model.predict(x_test_vect)
+
+    metrics = {
+        "accuracy": accuracy_score(y_test, y_pred),
+        "best_params": grid.best_params_,
+        "best_cv_f1_macro": grid.best_score_,
+        "classification_report": classification_report(y_test, y_pred, zero_division=0, output_dict=True),
+        "confusion_matrix": confusion_matrix(y_test, y_pred).tolist(),
+        "n_train": len(y_train),
+        "n_test": len(y_test),
+        "search": search,
+        "balance": balance,
+        "training_seconds": round(time.perf_counter() - started, 2),
+    }
+    return vect, best_model, metrics
+
+
+#Streaming Training
+# Labels are read in fixed-size chunks and folded into a partial_fit model, so memory depends
+# on stream_chunk_rows, not on the size of the labeled corpus. The hashing vectorizer has no
+# vocabulary to fit, and the manifest records how far into the JSONL file the model has read,
+# so `stream --update` only trains on lines appended since.
+stream_chunk_rows = 1000
+stream_vectorizer_params = {"ngram_range": (1, 2), "n_features": 1 << 20, "alternate_sign": False, "norm": "l2"}
+
+
+def iter_labeled_chunks(path=training_json_path, offset=0, chunk_rows=stream_chunk_rows, digest=None):
+    # Yields (excerpts, labels, end_offset). `digest` is fed every consumed byte, and a
+    # trailing line without a newline is left for the next run (it may still be written).
+    x, y = [], []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if digest is not None:
+                digest.update(line)
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            x.append(entry["excerpt"])
+            y.append(1 if entry["issue_flag"] == "Strong Evidence" else 0)
+            if len(x) >= chunk_rows:
+                yield x, y, offset
+                x, y = [], []
+    if x:
+        yield x, y, offset
+
+def _hash_prefix(path, length):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while length > 0:
+            chunk = f.read(min(1 << 16, length))
+            if not chunk:
+                break
+            digest.update(chunk)
+            length -= len(chunk)
+    return digest
+
+def stream_train(path=training_json_path, directory=model_dir, update=False, chunk_rows=stream_chunk_rows,
+                 random_state=42):
+    # Returns the new manifest, or None when --update finds no new labels
+    started = time.perf_counter()
+    if update:
+        manifest = read_manifest(directory)
+        if "training_offset" not in manifest:
+            raise ModelArtifactError(
+                f"Classifier {manifest['model_version']} was not trained by streaming. "
+                "Run `python classifier.py stream` without --update first."
+            )
+        offset = manifest["training_offset"]
+        digest = _hash_prefix(path, offset)
+        if digest.hexdigest() != manifest["training_prefix_sha256"]:
+            raise ModelArtifactError(
+                f"{os.path.basename(path)} changed before byte {offset}, not just appended to. "
+                "Run `python classifier.py stream` without --update to retrain."
+            )
+        artifact = joblib.load(os.path.join(directory, manifest["artifact"]))
+        vect, model = artifact["vectorizer"], artifact["model"]
+        metrics = dict(manifest["metrics"])
+    else:
+        offset, digest = 0, hashlib.sha256()
+        vect = HashingVectorizer(**stream_vectorizer_params)
+        model = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=random_state)
+        metrics = {"n_seen": 0, "n_correct": 0}
+
+    n_new = 0
+    for x, y, offset in iter_labeled_chunks(path, offset, chunk_rows, digest):
+        features = vect.transform(x)
+        # Progressive validation: each chunk is scored before the model learns from it
+        if hasattr(model, "classes_"):
+            metrics["n_correct"] += int((model.predict(features) == y).sum())
+            metrics["n_seen"] += len(y)
+        model.partial_fit(features, y, classes=[0, 1])
+        n_new += len(y)
+    if n_new == 0:
+        return None
+
+    metrics["progressive_accuracy"] = metrics["n_correct"] / metrics["n_seen"] if metrics["n_seen"] else None
+    metrics["n_train"] = metrics.get("n_train", 0) + n_new
+    metrics["training_seconds"] = round(time.perf_counter() - started, 2)
+    training_hash = digest.hexdigest()
+    return save_artifact(
+        vect, model, metrics, training_hash, directory,
+        extra={"training_offset": offset, "training_prefix_sha256": training_hash},
+    )
+
+
+#Artifact Storage
+def _atomic_write(path, write):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def save_artifact(vectorizer, model, metrics, training_hash, directory=model_dir, extra=None):
+    created_at = datetime.datetime.now(datetime.timezone.utc)
+    model_version = f"{created_at.strftime('%Y%m%dT%H%M%SZ')}-{training_hash[:8]}"
+    artifact_name = f"eb1a_classifier-{model_version}.joblib"
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model_version": model_version,
+        "artifact": artifact_name,
+        "created_at": created_at.isoformat(),
+        "training_data_sha256": training_hash,
+        "sklearn_version": sklearn.__version__,
+        "model": type(model).__name__,
+        "metrics": metrics,
+        **(extra or {}),
+    }
+    artifact = dict(manifest, vectorizer=vectorizer, model=model)
+
+    # The artifact is written first so the manifest never points at a partial file
+    _atomic_write(os.path.join(directory, artifact_name), lambda f: joblib.dump(artifact, f))
+    _atomic_write(
+        os.path.join(directory, manifest_name),
+        lambda f: f.write(json.dumps(manifest, indent=2, default=str).encode("utf-8")),
+    )
+    return manifest
+
+def read_manifest(directory=model_dir):
+    manifest_path = os.path.join(directory, manifest_name)
+    if not os.path.exists(manifest_path):
+        raise ModelArtifactError(
+            f"No classifier artifact in {directory}. Run `python classifier.py train` first."
+        )
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise ModelArtifactError(f"Cannot read classifier manifest {manifest_path}: {e}")
+
+def load_artifact(directory=model_dir, training_path=training_json_path, stale_policy=None):
+    stale_policy = stale_policy or os.environ.get("EB1A_MODEL_STALE_POLICY", "warn")
+    manifest = read_manifest(directory)
+    if not isinstance(manifest, dict) or "artifact" not in manifest or "training_data_sha256" not in manifest:
+        raise ModelArtifactError(f"Classifier manifest in {directory} is incomplete. Retrain the classifier.")
+
+    if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ModelArtifactError(
+            f"Artifact format {manifest.get('format_version')} is not supported "
+            f"(expected {ARTIFACT_FORMAT_VERSION}). Retrain the classifier."
+        )
+
+    stale = os.path.exists(training_path) and manifest["training_data_sha256"] != hash_training_data(training_path)
+    if stale:
+        message = (
+            f"Classifier {manifest['model_version']} was trained on a different "
+            f"{os.path.basename(training_path)}. Run `python classifier.py train` to refresh it."
+        )
+        if stale_policy == "refuse":
+            raise ModelArtifactError(message)
+        print(f"⚠️ {message}")
+
+    artifact_path = os.path.join(directory, manifest["artifact"])
+    try:
+        artifact = joblib.load(artifact_path)
+    except Exception as e:
+        # Missing, truncated or unpicklable (e.g. written by an incompatible scikit-learn)
+        raise ModelArtifactError(f"Cannot load classifier artifact {artifact_path}: {type(e).__name__}: {e}")
+    artifact["stale"] = stale
+    return artifact
+
+
+#Lazy Server Access
+_artifact = None
+_artifact_lock = threading.Lock()
+_checked_at = 0.0
+# Version of an artifact that failed to load, so a broken one is reported once, not every check
+_rejected = None
+
+def get_classifier():
+    # After `train` or `stream --update` writes a new manifest, the next call past the watch
+    # interval swaps the new model in. Callers holding the old artifact finish with it.
+    global _artifact, _checked_at, _rejected
+    artifact = _artifact
+    if artifact is None:
+        with _artifact_lock:
+            if _artifact is None:
+                _artifact = load_artifact()
+                _checked_at = time.monotonic()
+        return _artifact
+    if model_watch_seconds > 0 and time.monotonic() - _checked_at >= model_watch_seconds:
+        _checked_at = time.monotonic()
+        try:
+            latest = read_manifest()["model_version"]
+        except (ModelArtifactError, KeyError):
+            return artifact
+        if latest != artifact["model_version"] and latest != _rejected:
+            with _artifact_lock:
+                if _artifact is artifact:
+                    try:
+                        _artifact = load_artifact()
+                        print(f"🤖 Classifier {_artifact['model_version']} loaded, replacing {artifact['model_version']}")
+                    except ModelArtifactError as e:
+                        _rejected = latest
+                        print(f"⚠️ Keeping classifier {artifact['model_version']}: {e}")
+    return _artifact
+
+def classifier_info():
+    artifact = get_classifier()
+    return {key: value for key, value in artifact.items() if key not in ("vectorizer", "model")}
+
+
+#Inference
+def predict_strength(texts):
+    # P("Strong Evidence") for each text, from a single transform and predict_proba call
+    if not texts:
+        return []
+    artifact = get_classifier()
+    model = artifact["model"]
+    probabilities = model.predict_proba(artifact["vectorizer"].transform(texts))
+    return probabilities[:, list(model.classes_).index(1)].tolist()
+
+def model_version():
+    # None when no artifact has been trained yet
+    try:
+        return get_classifier()["model_version"]
+    except ModelArtifactError:
+        return None
+
+
+#Entry Point
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or inspect the EB1A evidence-strength classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train = subparsers.add_parser("train", help="fit the classifier and write a new artifact")
+    train.add_argument("--data", default=training_json_path, help="labeled JSONL excerpts")
+    train.add_argument("--out", default=model_dir, help="artifact directory")
+    train.add_argument("--quiet", action="store_true", help="silence search progress")
+    train.add_argument("--search", choices=("halving", "grid"), default="halving",
+                       help="successive halving over forest size, or the exhaustive grid")
+    train.add_argument("--balance", choices=("class_weight", "upsample"), default="class_weight",
+                       help="weight classes in the loss, or duplicate minority rows")
+    train.add_argument("--jobs", type=int, default=-1, help="parallel search workers (-1 = all cores)")
+    train.add_argument("--no-feature-cache", action="store_true", help="always re-vectorize the data")
+
+    stream = subparsers.add_parser("stream", help="fit an online model chunk by chunk from the JSONL file")
+    stream.add_argument("--data", default=training_json_path, help="labeled JSONL excerpts")
+    stream.add_argument("--out", default=model_dir, help="artifact directory")
+    stream.add_argument("--update", action="store_true", help="only learn from lines appended since the last run")
+    stream.add_argument("--chunk-rows", type=int, default=stream_chunk_rows, help="excerpts held in memory at once")
+
+    info = subparsers.add_parser("info", help="show the current artifact and whether it is stale")
+    info.add_argument("--dir", default=model_dir, help="artifact directory")
+    info.add_argument("--data", default=training_json_path, help="labeled JSONL excerpts")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        x, y = load_training_data(args.data)
+        vect, best_model, metrics = train_classifier(
+            x, y, verbose=0 if args.quiet else 2, search=args.search, balance=args.balance, n_jobs=args.jobs,
+            cache_dir=None if args.no_feature_cache else os.path.join(args.out, "feature_cache"),
+        )
+        manifest = save_artifact(vect, best_model, metrics, hash_training_data(args.data), args.out)
+
+        print("\n✅ Best Model:", best_model)
+        print("\n🎯 Accuracy Score:", metrics["accuracy"])
+        print(f"\n⏱️ Trained in {metrics['training_seconds']} s ({args.search} search, {args.balance})")
+        print("\n🧾 Confusion Matrix:\n", metrics["confusion_matrix"])
+        print(f"\n💾 Saved {manifest['artifact']} to {args.out}")
+    elif args.command == "stream":
+        manifest = stream_train(args.data, args.out, update=args.update, chunk_rows=args.chunk_rows)
+        if manifest is None:
+            print("✅ No new labeled excerpts; the current model is up to date")
+            return
+        metrics = manifest["metrics"]
+        print(f"\n🎯 Progressive Accuracy: {metrics['progressive_accuracy']} over {metrics['n_seen']} excerpts")
+        print(f"\n⏱️ {metrics['n_train']} excerpts learned in total, this run took {metrics['training_seconds']} s")
+        print(f"\n💾 Saved {manifest['artifact']} to {args.out}")
+    else:
+        manifest = read_manifest(args.dir)
+        manifest["stale"] = manifest["training_data_sha256"] != hash_training_data(args.data)
+        print(json.dumps(manifest, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import gc
+import os
+
+# Multi-worker server: gunicorn -c gunicorn.conf.py main:app
+#
+# The app is imported once in the master (preload_app) and main.preload() loads the
+# classifier, report template and letter index there. Workers are forked afterwards and
+# share those pages copy-on-write, so adding workers does not add copies of the model.
+
+# Every worker starts its own process pools, which do not share the preloaded pages:
+# EB1A_REPORT_WORKERS render processes (default 2), EB1A_EXTRACT_WORKERS page extraction
+# processes for long PDFs (default up to 4) and, with EB1A_EXECUTOR=process,
+# EB1A_ANALYSIS_WORKERS analysis processes. At peak that is
+#   workers × (1 + report + extract [+ analysis]) processes,
+# e.g. 2 × (1 + 2 + 4) = 14 for the defaults here, 56 for 8 workers. Two workers (fewer
+# on a single CPU) keep a shared host from running out of memory; raise EB1A_WEB_WORKERS
+# only after measuring the memory per worker with benchmarks/loadtest.py.
+_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get("EB1A_WEB_WORKERS", str(min(2, _cpus))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Large PDFs can take a while to analyze; streaming responses stay open until done
+timeout = int(os.environ.get("EB1A_WORKER_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before the first worker is forked
+    import main
+    main.preload()
+    # Objects that exist now are left out of every later collection. Otherwise the
+    # collector in each worker would write to their headers and un-share their pages.
+    gc.freeze()
+    server.log.info(f"Preloaded shared state; {gc.get_freeze_count()} objects frozen for {workers} workers")
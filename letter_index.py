@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import zlib
+import fcntl
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from analyzer import SUPPORTED_EXTENSIONS, normalize, load_document, letters_or_whole_document
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+index_dir = os.environ.get("EB1A_LETTER_INDEX_DIR", os.path.join(base_dir, "letter_index"))
+
+num_perm = 128
+bands = 32
+shingle_words = 5
+# A letter is flagged when either estimate reaches its threshold
+jaccard_threshold = float(os.environ.get("EB1A_TEMPLATE_JACCARD", "0.5"))
+cosine_threshold = float(os.environ.get("EB1A_TEMPLATE_COSINE", "0.9"))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(20240601)
+_perm_a = _rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+_perm_b = _rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+# Stateless, so vectors stay comparable as the index grows and never need refitting
+_vectorizer = HashingVectorizer(n_features=1 << 18, alternate_sign=False, norm="l2", stop_words="english")
+
+
+#Fingerprints
+def shingle_hashes(body):
+    words = body.split()
+    if len(words) < shingle_words:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + shingle_words]) for i in range(len(words) - shingle_words + 1)]
+    return np.fromiter({zlib.crc32(s.encode("utf-8")) for s in shingles}, dtype=np.uint64)
+
+def minhash(body):
+    # None for letters with no words, which would otherwise all look identical
+    hashes = shingle_hashes(body)
+    if len(hashes) == 0:
+        return None
+    signature = np.full(num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+    # a * h + b stays below 2**64 because a, b and h are all 32-bit
+    for start in range(0, len(hashes), 4096):
+        chunk = hashes[start:start + 4096]
+        permuted = (np.outer(_perm_a, chunk) + _perm_b[:, None]) % _MERSENNE_PRIME
+        signature = np.minimum(signature, (permuted & np.uint64(0xFFFFFFFF)).astype(np.uint32).min(axis=1))
+    return signature
+
+def band_keys(signature):
+    rows = num_perm // bands
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+def letter_sha(body):
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class LetterIndex:
+    # Recommendation letters from every analyzed document, stored as append-only segment
+    # files (MinHash signatures, hashed term vectors and metadata in one .npz each).
+    #
+    # Adding letters writes one new segment; nothing is rebuilt. In memory, every
+    # signature is banded into an LSH table, so a query only verifies the few letters
+    # sharing a band with it. Other processes pick up new segments on their next call.
+    #
+    # Every document belongs to a petition: its own, or that of the earlier draft it
+    # replaces. Letters are only compared with letters of other petitions, so a revised
+    # draft is not flagged for reusing its own letters.
+
+    def __init__(self, directory=index_dir):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._segments = {}
+        self._records = []
+        # Signatures and vectors stay in per-segment blocks; _locations maps a letter id
+        # to its (block, row)
+        self._signature_blocks = []
+        self._vector_blocks = []
+        self._locations = []
+        self._buckets = {}
+        self._seen = set()
+        self._petitions = {}
+
+    #Segments
+    def _segment_names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("segment-") and name.endswith(".npz"))
+
+    def _load_segment(self, name):
+        with np.load(os.path.join(self.directory, name), allow_pickle=False) as segment:
+            records = json.loads(str(segment["records"]))
+            signatures = segment["signatures"]
+            vectors = csr_matrix(
+                (segment["data"], segment["indices"], segment["indptr"]),
+                shape=(len(records), _vectorizer.n_features),
+            )
+        self._segments[name] = len(records)
+        self._append(records, signatures, vectors)
+
+    def _append(self, records, signatures, vectors):
+        block = len(self._signature_blocks)
+        self._signature_blocks.append(signatures)
+        self._vector_blocks.append(vectors)
+        for row, record in enumerate(records):
+            letter_id = len(self._records)
+            self._records.append(record)
+            self._locations.append((block, row))
+            self._seen.add((record["document"], record["sha256"]))
+            self._petitions.setdefault(record["document"], record.get("petition", record["document"]))
+            for key in band_keys(signatures[row]):
+                self._buckets.setdefault(key, []).append(letter_id)
+
+    def refresh(self):
+        names = self._segment_names()
+        if any(name not in names for name in self._segments):
+            # Segments were compacted by another process; start from the new files
+            self._reset()
+        for name in names:
+            if name not in self._segments:
+                self._load_segment(name)
+
+    def _write_segment(self, records, signatures, vectors):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"segment-{time.time_ns():020d}-{os.getpid()}.npz"
+        tmp_path = os.path.join(self.directory, f".{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                records=np.array(json.dumps(records)),
+                signatures=signatures,
+                data=vectors.data, indices=vectors.indices, indptr=vectors.indptr,
+            )
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        return name
+
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(os.path.join(self.directory, ".lock"), "w")
+
+    #Queries
+    def _query(self, signature, vector, document, petition):
+        candidates = set()
+        for key in band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        matches = []
+        for letter_id in candidates:
+            record = self._records[letter_id]
+            if record["document"] == document or record.get("petition", record["document"]) == petition:
+                continue
+            block, row = self._locations[letter_id]
+            jaccard = float(np.mean(self._signature_blocks[block][row] == signature))
+            cosine = float(self._vector_blocks[block][row].multiply(vector).sum())
+            if jaccard >= jaccard_threshold or cosine >= cosine_threshold:
+                matches.append({
+                    "matched_document": record["label"],
+                    "matched_letter": record["header"],
+                    "matched_at": record["added_at"],
+                    "jaccard": round(jaccard, 4),
+                    "similarity": round(cosine, 4),
+                })
+        matches.sort(key=lambda m: (-m["jaccard"], -m["similarity"]))
+        return matches
+
+    def check_and_add(self, document, letters, label=None, add=True, replaces=None):
+        # letters: [(header, body), ...] from one document, identified by its SHA-256.
+        # replaces: the SHA-256 of an earlier draft of the same petition, if any.
+        # Returns one entry per letter that resembles a letter from another petition.
+        bodies = [normalize(body) for _, body in letters]
+        signatures = [minhash(body) for body in bodies]
+        rows = [row for row, signature in enumerate(signatures) if signature is not None]
+        if not rows:
+            return []
+        vectors = _vectorizer.transform([bodies[row] for row in rows])
+
+        with self._lock:
+            self.refresh()
+            petition = self._petition(document, replaces)
+            results = []
+            for i, row in enumerate(rows):
+                matches = self._query(signatures[row], vectors[i], document, petition)
+                if matches:
+                    results.append({"letter": letters[row][0], "matches": matches})
+
+            if add:
+                self._add(document, petition, label or document, [letters[row][0] for row in rows],
+                          [bodies[row] for row in rows], np.vstack([signatures[row] for row in rows]), vectors)
+        return results
+
+    def _petition(self, document, replaces):
+        if replaces is not None and replaces != document:
+            return self._petitions.get(replaces, replaces)
+        return self._petitions.get(document, document)
+
+    def _add(self, document, petition, label, headers, bodies, signatures, vectors):
+        added_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        with self._write_lock() as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process (e.g. a second server worker) may have added the same
+            # document since the check; its segment is loaded before deduplicating
+            self.refresh()
+            keep, records = [], []
+            for row, (header, body) in enumerate(zip(headers, bodies)):
+                sha = letter_sha(body)
+                if (document, sha) in self._seen:
+                    continue
+                self._seen.add((document, sha))
+                keep.append(row)
+                records.append({
+                    "document": document, "petition": petition, "label": label, "header": header,
+                    "sha256": sha, "added_at": added_at,
+                })
+            if not records:
+                return
+
+            signatures, vectors = signatures[keep], vectors[keep]
+            name = self._write_segment(records, signatures, vectors)
+        self._segments[name] = len(records)
+        self._append(records, signatures, vectors)
+
+    def compact(self):
+        # Merge every segment into one file; safe while other processes keep reading
+        with self._lock, self._write_lock() as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._reset()
+            self.refresh()
+            if len(self._segments) < 2:
+                return
+            old_names = list(self._segments)
+            self._write_segment(
+                self._records, np.vstack(self._signature_blocks), vstack(self._vector_blocks).tocsr()
+            )
+            for old in old_names:
+                os.remove(os.path.join(self.directory, old))
+            self._reset()
+            self.refresh()
+
+    def stats(self):
+        with self._lock:
+            self.refresh()
+            return {
+                "letters": len(self._records),
+                "documents": len({record["document"] for record in self._records}),
+                "petitions": len(set(self._petitions.values())),
+                "segments": len(self._segments),
+                "buckets": len(self._buckets),
+            }
+
+
+#Entry Point
+def _iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+def letters_from_file(path):
+    return letters_or_whole_document(load_document(path), os.path.basename(path))
+
+def file_sha(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the cross-petition recommendation letter index.")
+    parser.add_argument("--dir", default=index_dir, help="index directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="index the letters in files or directories")
+    add.add_argument("paths", nargs="+")
+    check = subparsers.add_parser("check", help="compare documents against the index without adding them")
+    check.add_argument("paths", nargs="+")
+    subparsers.add_parser("compact", help="merge all segments into one file")
+    subparsers.add_parser("stats", help="show index size")
+    args = parser.parse_args(argv)
+
+    index = LetterIndex(args.dir)
+    if args.command in ("add", "check"):
+        for path in _iter_files(args.paths):
+            try:
+                letters = letters_from_file(path)
+            except Exception as e:
+                print(f"⚠️ Skipping {path}: {e}")
+                continue
+            started = time.perf_counter()
+            results = index.check_and_add(file_sha(path), letters, label=os.path.basename(path), add=args.command == "add")
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"📄 {os.path.basename(path)}: {len(letters)} letters, {len(results)} resemble earlier filings ({elapsed:.0f} ms)")
+            for result in results:
+                for match in result["matches"]:
+                    print(f"   ⚠️ {result['letter']} ↔ {match['matched_letter']} in {match['matched_document']} "
+                          f"| Jaccard: {match['jaccard']:.2f} Cosine: {match['similarity']:.2f}")
+    elif args.command == "compact":
+        index.compact()
+        print(json.dumps(index.stats(), indent=2))
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
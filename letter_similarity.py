@@ -0,0 +1,72 @@
+import zlib
+
+import numpy as np
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize as l2_normalize
+
+
+# Rows of the letter matrix compared against every letter at once; bounds memory to
+# block_rows x n similarities instead of the full n x n matrix
+block_rows = 256
+# Passages are runs of shared word n-grams of this length
+passage_ngram = 8
+
+
+#Similar Pairs
+def tfidf_rows(bodies):
+    try:
+        matrix = TfidfVectorizer().fit_transform(bodies)
+    except ValueError:
+        # Every body was empty or had no usable tokens
+        return None
+    return l2_normalize(matrix)
+
+def find_similar_pairs(bodies, threshold=0.9):
+    # [(i, j, cosine)] for i < j with TF-IDF cosine similarity above threshold, in (i, j) order.
+    # Scores equal sklearn's cosine_similarity; the matrix is multiplied one row block at a
+    # time and stays sparse, so only pairs above the threshold are ever kept in Python.
+    if len(bodies) < 2:
+        return []
+    matrix = tfidf_rows(bodies)
+    if matrix is None:
+        return []
+
+    pairs = []
+    transposed = matrix.T.tocsc()
+    for start in range(0, matrix.shape[0], block_rows):
+        block = (matrix[start:start + block_rows] @ transposed).tocoo()
+        rows = block.row + start
+        keep = (block.col > rows) & (block.data > threshold)
+        pairs.extend(zip(rows[keep].tolist(), block.col[keep].tolist(), block.data[keep].tolist()))
+    pairs.sort()
+    return pairs
+
+
+#Passage Overlap
+def _ngram_hashes(words, n):
+    return [zlib.crc32(" ".join(words[i:i + n]).encode("utf-8")) for i in range(len(words) - n + 1)]
+
+def overlapping_passages(body_1, body_2, n=passage_ngram, limit=5):
+    # Longest runs of text in body_1 that also appear word-for-word in body_2
+    words_1, words_2 = body_1.split(), body_2.split()
+    if len(words_1) < n or len(words_2) < n:
+        return []
+
+    shared = set(_ngram_hashes(words_2, n))
+    covered = np.zeros(len(words_1), dtype=bool)
+    for i, h in enumerate(_ngram_hashes(words_1, n)):
+        if h in shared:
+            covered[i:i + n] = True
+
+    passages = []
+    start = None
+    for i, flag in enumerate(covered.tolist() + [False]):
+        if flag and start is None:
+            start = i
+        elif not flag and start is not None:
+            passages.append((i - start, start, " ".join(words_1[start:i])))
+            start = None
+
+    passages.sort(key=lambda p: (-p[0], p[1]))
+    return [{"words": length, "text": text} for length, _, text in passages[:limit]]
@@ -1,422 +1,557 @@
 import os
-import re
-import fitz
-import docx
 import json
-import random
-import string
+import time
+import asyncio
+import hashlib
+import shutil
+import zipfile
+import secrets
 import tempfile
 import uvicorn
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import FastAPI, File, Header, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.responses import FileResponse
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-from sklearn.utils import resample
-from sklearn.metrics.pairwise import cosine_similarity
-from report_generator import generate_pdf_report
-from fastapi.staticfiles import StaticFiles
+import metrics
+import workers
+from analyzer import (
+    SUPPORTED_EXTENSIONS, DocumentTooLarge, analysis_events, analyze_document_bytes, diff_findings,
+    document_chunks, analysis_version, find_repetitive_letters, letters_or_whole_document,
+)
+from letter_index import LetterIndex
+from analysis_cache import AnalysisCache, is_valid_key, make_key
+from workers import UploadTooLarge, analysis_slots, expand_zip_uploads, read_upload, run_cpu_bound
+from report_generator import (
+    generate_report, is_valid_report_id, media_types, new_report_id, report_formats, report_path, warm_up,
+)
+import report_jobs
+from report_jobs import ReportQueueFull, submit_report, report_status
+from classifier import ModelArtifactError, classifier_info, get_classifier
+from rule_packs import RulePackError, active_pack, reload_rule_pack
+from precedent_index import get_precedent_index
 
 
 
 app = FastAPI()
 
-# Mount the "reports" folder to serve static files (like the PDF)
-app.mount("/reports", StaticFiles(directory="reports"), name="reports")
-
-# Import your routes or define them here
-from fastapi.responses import FileResponse
+# Required in the X-Admin-Token header of admin endpoints; they are disabled when unset
+admin_token = os.environ.get("EB1A_ADMIN_TOKEN")
+
+analysis_cache = AnalysisCache()
+letter_index = LetterIndex()
+
+# Read at scrape time from the components that already keep these numbers in memory,
+# so a scrape never walks the cache directory
+metrics.Callback("eb1a_cache_lookups_total", "Result cache lookups by outcome.", analysis_cache.lookup_counts,
+                 kind="counter", labelname="outcome")
+metrics.Callback("eb1a_cache_disk_bytes", "Bytes used by the on-disk result cache (running estimate).",
+                 analysis_cache.disk_usage)
+metrics.Callback("eb1a_report_queue_depth", "Reports queued or rendering.", report_jobs.queue_depth)
+metrics.Callback("eb1a_analyses_in_flight", "Analysis requests admitted and not yet answered.",
+                 lambda: analysis_slots.active)
+
+def preload():
+    # Loads the read-only state every request needs: the rule pack, the classifier, the report
+    # template, the letter index and the precedent index (memory-mapped). gunicorn.conf.py
+    # calls this in the master before forking, so all server workers share one copy.
+    active_pack()
+    try:
+        get_classifier()
+    except ModelArtifactError as e:
+        print(f"⚠️ Classifier not preloaded: {e}")
+    warm_up(stylesheet=False)
+    letter_index.stats()
+    get_precedent_index().stats()
+
+@app.on_event("shutdown")
+def stop_report_workers():
+    report_jobs.shutdown(wait=False)
+    workers.shutdown(wait=False)
+
+# Endpoints that parse uploads and run the analysis pipeline, with their body size limits
+admission_paths = {
+    "/analyze/": workers.max_upload_bytes,
+    "/analyze/batch/": workers.max_batch_bytes,
+    "/analyze/stream": workers.max_upload_bytes,
+}
 
-app.mount("/reports", StaticFiles(directory="reports"), name="reports")
+@app.middleware("http")
+async def limit_analysis_load(request: Request, call_next):
+    # Runs before the multipart body is read, so rejected uploads cost almost nothing
+    if request.method != "POST" or request.url.path not in admission_paths:
+        return await call_next(request)
+
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > admission_paths[request.url.path]:
+        return JSONResponse(status_code=413, content={"detail": "Upload too large"})
+    if not analysis_slots.try_acquire():
+        return JSONResponse(status_code=503, content={"detail": "Server busy, retry shortly"},
+                            headers={"Retry-After": "5"})
+    try:
+        return await call_next(request)
+    finally:
+        # /analyze/stream hands its slot to the background analysis, which releases it
+        if not getattr(request.state, "keeps_admission_slot", False):
+            analysis_slots.release()
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    # Registered last, so it wraps limit_analysis_load and also counts its 413/503 answers
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None:
+        path = route.path
+    else:
+        path = request.url.path if request.url.path in admission_paths else "unmatched"
+    metrics.requests_total.inc(route=path, status=response.status_code)
+    return response
 
 @app.get("/")
 async def root():
     return {"message": "Hello, FastAPI"}
 
 @app.get("/download-report")
-def download_report():
-    report_path = "reports/eb1a_risk_report.pdf"
-    if os.path.exists(report_path):
-        return FileResponse(path=report_path, filename="EB1A_Risk_Report.pdf", media_type="application/pdf")
-    return {"error": "Report not found."}
-
-
-
-
-base_dir = os.path.dirname(os.path.abspath(__file__))
-
-petition_folder = os.path.join(base_dir, "testing_documents")
-recommendation_folder = os.path.join(base_dir, "recommendation_letters")
-training_json_path = os.path.join(base_dir, "training_data.json")
-
-
-
-from fastapi.staticfiles import StaticFiles
-app.mount("/reports", StaticFiles(directory="reports"), name="reports")
+def download_report(report_id: str):
+    return get_pdf(report_id)
 
+# The AAO corpus scan that used to run here at import lives in batch_analyze.py
 
- 
-
-#File Utilities
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
-
-def extract_text_from_docx(docx_path):
-    doc = docx.Document(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def load_document(file_path):
-    if file_path.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    elif file_path.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith(".txt"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-    else:
-        raise ValueError("Unsupported file format. Please use .pdf, .docx, or .txt")
-
-#Criterion Segmentation
-def segment_by_criterion(text):
-    pattern = r"(Criterion\s+\d+\s*[:\-–]\s*[^\n]*)"
-    parts = re.split(pattern, text, flags=re.IGNORECASE)
-    criterion_sections = {}
-    for i in range(1, len(parts), 2):
-        header = parts[i].strip()
-        body = parts[i + 1].strip() if i + 1 < len(parts) else ""
-        criterion_sections[header] = body
-    return criterion_sections
-
-
-#Normalization
-def normalize(text):
-    return text.lower().translate(str.maketrans('', '', string.punctuation))
-
-#Expectation Matching
-def detect_missing_signals(text, criterion):
-    expected = evidence_expectations.get(criterion, [])
-    return [f"Missing expected detail: {keyword}" for keyword in expected if keyword.lower() not in text]
-
-def apply_advanced_rule_based_check(section_text):
-    results = []
-    cleaned = normalize(section_text)
-    for criterion, rule in EB1A_RULES.items():
-        if any(k in cleaned for k in rule["keywords"]):
-            issues = []
-            for phrase, message in rule["red_flags"]:
-                if phrase in cleaned:
-                    issues.append(message)
-            issues += detect_missing_signals(cleaned, criterion)
-            results.append({
-                "matched_criterion": criterion,
-                "issues": issues or ["None detected"],
-                "excerpt": section_text[:300] + "..." if len(section_text) > 300 else section_text
-            })
-    return results
-
-
-
-#Recommendation Letter Analysis
-def extract_recommendation_letters(text):
-    pattern = r"(Letter\s+from\s+[^\n]+|Recommendation\s+Letter\s+from\s+[^\n]+)"
-    chunks = re.split(pattern, text, flags=re.IGNORECASE)
-    letters = []
-    for i in range(1, len(chunks), 2):
-        header = chunks[i].strip()
-        body = chunks[i + 1].strip() if i + 1 < len(chunks) else ""
-        letters.append((header, body))
-    return letters
-
-def detect_repetitive_letters(letters, threshold=0.9):
-    if len(letters) < 2:
-        return []
-    bodies = [normalize(body) for _, body in letters]
-    vect = TfidfVectorizer().fit_transform(bodies)
-    sim_matrix = cosine_similarity(vect)
-
-    flags = []
-    for i in range(len(letters)):
-        for j in range(i + 1, len(letters)):
-            sim_score = sim_matrix[i][j]
-            if sim_score > threshold:
-                flags.append((letters[i][0], letters[j][0], sim_score))
-    return flags
-
-def analyze_recommendation_folder(rec_folder_path):
-    rec_texts = []
-    for filename in os.listdir(rec_folder_path):
-        file_path = os.path.join(rec_folder_path, filename)
+def _queue_report(cache_key, analysis, report_id=None):
+    # ✅ Queue the PDF report; findings go back without waiting for WeasyPrint
+    try:
+        report_id = submit_report(
+            analysis, report_id, on_done=lambda _, pdf_path: analysis_cache.attach_pdf(cache_key, pdf_path)
+        )
+        return report_id, "queued"
+    except ReportQueueFull as e:
+        print("⚠️ Report not queued:", e)
+        return None, "unavailable"
+    except Exception as e:
+        # The findings are still worth returning when the render pool cannot take the job
+        print(f"⚠️ Report not queued: {type(e).__name__}: {e}")
+        return None, "unavailable"
+
+def _restore_report(cache_key, cached):
+    report_id = cached.get("report_id") or new_report_id()
+    pdf_path = report_path(report_id)
+    if os.path.exists(pdf_path):
+        return report_id, "done"
+    status = report_status(report_id, "pdf")
+    if status is not None and status["status"] in ("queued", "rendering"):
+        return report_id, status["status"]
+
+    cached_pdf = analysis_cache.pdf_path(cache_key)
+    if cached_pdf is not None:
+        # Copied under a temporary name, so other workers never see a partial PDF
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(pdf_path), prefix=f".{report_id}.", suffix=".tmp")
+        os.close(fd)
         try:
-            text = load_document(file_path)
-            rec_texts.append((filename, text))
-            print(f"📄 Loaded recommendation: {filename}")
-        except Exception as e:
-            print(f"⚠️ Skipping {filename}: {e}")
-
-    full_text = "\n\n".join([t for _, t in rec_texts])
-    letters = extract_recommendation_letters(full_text)
-    flags = detect_repetitive_letters(letters)
-
-    if flags:
-        print("\n⚠️ Repetition Detected in Letters:")
-        for l1, l2, score in flags:
-            print(f" - {l1} ↔ {l2} | Similarity: {score:.2f}")
-    else:
-        print("\n✅ No significant repetition across letters.")
-
-#Load Petition Documents
-all_texts = []
-for filename in os.listdir(petition_folder):
-    file_path = os.path.join(petition_folder, filename)
+            shutil.copyfile(cached_pdf, tmp_path)
+            os.replace(tmp_path, pdf_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return report_id, "done"
+    return _queue_report(cache_key, cached["analysis"], report_id)
+
+def _write_report(analysis, report_id, report_format):
+    # ✅ HTML and JSON reports skip WeasyPrint, so they are written before responding
+    report_id = report_id or new_report_id()
     try:
-        text = load_document(file_path)
-        all_texts.append((filename, text))
-        print(f"✅ Loaded: {filename}")
+        generate_report(analysis, report_id, report_format)
+        return report_id, "done"
     except Exception as e:
-        print(f"❌ Skipping {filename}: {e}")
-
-
-
-
-EB1A_RULES = {
-"Criterion 1": {
-"title": "Prizes or Awards for Excellence",
-"keywords": ["award", "prize", "fellowship", "recognition", "honor", "competition", "medal"],
-"red_flags": [
-("local", "Award appears to be local or school-level."),
-("department", "Award is limited to a department."),
-("not well known", "Award lacks recognized national or international prestige."),
-("team", "Award may not have been given to individual specifically.")
-]
-},
-"Criterion 2": {
-"title": "Membership in Reputable Associations",
-"keywords": ["member", "association", "fellow", "admission", "committee", "invitation"],
-"red_flags": [
-("anyone can join", "Association has open or fee-based membership."),
-("fee", "Membership appears to require payment rather than achievement."),
-("no review", "No evidence of expert peer review in admission process.")
-]
-},
-"Criterion 3": {
-"title": "Published Material About the Person",
-"keywords": ["media", "featured", "profile", "press", "interview", "coverage", "article", "publication"],
-"red_flags": [
-("employer", "Media discusses employer or team, not individual."),
-("marketing", "Coverage seems promotional or internal."),
-("no author", "No identifiable date, source, or author.")
-]
-},
-"Criterion 4": {
-"title": "Judging the Work of Others",
-"keywords": ["review", "judge", "committee", "evaluator", "dissertation", "panel", "abstract", "referee"],
-"red_flags": [
-("student", "Judging was at student or informal level."),
-("invited", "Only invitation mentioned—no proof of actual judging."),
-("newsletter", "Judging activity lacks professional/peer-reviewed status.")
-]
-},
-"Criterion 5": {
-"title": "Original Contributions of Major Significance",
-"keywords": ["contribution", "innovation", "impact", "patent", "citation", "original work", "discovery"],
-"red_flags": [
-("internal", "Contribution recognized only within company."),
-("no citation", "No citation metrics or third-party validation."),
-("unpublished", "Claimed contribution is unpublished or unverified.")
-]
-},
-"Criterion 6": {
-"title": "Authorship of Scholarly Articles",
-"keywords": ["author", "publication", "journal", "conference", "paper", "article", "proceedings"],
-"red_flags": [
-("blog", "Publication is a blog or non-scholarly source."),
-("no peer review", "Article lacks peer review or editorial board."),
-("not indexed", "Journal not indexed or recognized in the field.")
-]
-},
-"Criterion 7": {
-"title": "Artistic Exhibitions or Showcases",
-"keywords": ["exhibit", "gallery", "artwork", "showcase", "installation", "display"],
-"red_flags": [
-("local", "Exhibition appears to be local or informal."),
-("community", "Venue lacks artistic or national prestige."),
-("not individual", "Exhibit does not highlight individual’s work.")
-]
-},
-"Criterion 8": {
-"title": "Leading or Critical Role in Distinguished Organizations",
-"keywords": ["leader", "founder", "director", "head", "critical role", "project lead", "chief"],
-"red_flags": [
-("no impact", "Role not demonstrated to influence organization."),
-("contractor", "Role appears to be limited or not senior."),
-("no proof", "No documentation of contributions or results.")
-]
-},
-"Criterion 9": {
-"title": "High Salary or Remuneration",
-"keywords": ["salary", "income", "remuneration", "compensation", "pay", "bonus", "offer letter"],
-"red_flags": [
-("no comparison", "No industry benchmark or comparative data."),
-("prospective", "Salary offer is future or conditional."),
-("no proof", "No pay stubs, tax returns, or official letters.")
-]
-},
-"Criterion 10": {
-"title": "Commercial Success in Performing Arts",
-"keywords": ["box office", "album sales", "chart", "tour", "tickets", "downloads", "streaming", "royalties"],
-"red_flags": [
-("no revenue", "No data on commercial performance."),
-("small venue", "Event may not demonstrate large-scale success."),
-("no proof", "No press, revenue records, or independent reviews.")
-]
-}
-}
-evidence_expectations = {
-"Criterion 1": ["award name", "national", "international", "competition", "selection", "number of recipients"],
-"Criterion 2": ["review board", "nomination", "peer evaluation", "selection process"],
-"Criterion 3": ["publication title", "media name", "author", "date", "quote about applicant"],
-"Criterion 4": ["journal name", "review confirmation", "conference name", "dissertation"],
-"Criterion 5": ["citation count", "h-index", "patent", "letter of impact", "commercial use"],
-"Criterion 6": ["journal name", "impact factor", "peer-reviewed", "conference name"],
-"Criterion 7": ["exhibition name", "venue", "city", "curator", "gallery"],
-"Criterion 8": ["role title", "organization name", "project outcome", "performance data"],
-"Criterion 9": ["salary amount", "comparative survey", "currency", "region", "position type"],
-"Criterion 10": ["ticket sales", "album chart", "revenue", "box office", "platform"],
-}
-
-# Run Rule-Based Checks 
-for filename, text in all_texts:
-    print(f"\n📄 Scanning: {filename}")
-    segments = segment_by_criterion(text)
-    for header, content in segments.items():
-        findings = apply_advanced_rule_based_check(content)
-        for result in findings:
-            if "None detected" not in result["issues"]:
-                print(f"\n🔹 Criterion: {result['matched_criterion']}")
-                print(f"Excerpt: {result['excerpt']}")
-                print(f"⚠️ Issues: {result['issues']}")
-
-#ML Model Training
-training_json_path = os.path.join(base_dir, "training_data.json")
-
-with open(training_json_path, "r") as f:
-    data = [json.loads(line) for line in f]
-    x = [entry["excerpt"] for entry in data]
-    y = [1 if entry["issue_flag"] == "Strong Evidence" else 0 for entry in data]
-
-# Combine and balance the dataset
-combined = list(zip(x, y))
-majority = [pair for pair in combined if pair[1] == 0]
-minority = [pair for pair in combined if pair[1] == 1]
-
-minority_upsampled = resample(minority, replace=True, n_samples=len(majority), random_state=42)
-balanced = majority + minority_upsampled
-random.shuffle(balanced)
-
-x_bal, y_bal = zip(*balanced)
-
-# Split the balanced dataset
-x_train, x_test, y_train, y_test = train_test_split(x_bal, y_bal, random_state=42, test_size=0.2)
-
-# Vectorize text
-vect = TfidfVectorizer(ngram_range=(1, 2), max_features=1000)
-x_train_vect = vect.fit_transform(x_train)
-x_test_vect = vect.transform(x_test)
-
-# Set parameter grid for GridSearch
-param_grid = {
-    'n_estimators': [100, 200],
-    'max_depth': [None, 10],
-    'min_samples_split': [2, 5],
-    'min_samples_leaf': [1, 2]
-}
-
-# Train classifier with class weights
-clf = RandomForestClassifier(random_state=42)
-grid = GridSearchCV(clf, param_grid, scoring='f1_macro', cv=5, n_jobs=1, verbose=2)
-grid.fit(x_train_vect, y_train)
-
-# Evaluate
-best_model = grid.best_estimator_
-y_pred = best_model.predict(x_test_vect)
-
-print("\n✅ Best Model:", best_model)
-print("\n🎯 Accuracy Score:", accuracy_score(y_test, y_pred))
-print("\n📊 Classification Report:\n", classification_report(y_test, y_pred, zero_division=0))
-print("\n🧾 Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
-
-
-# Example usage inside your document loop
-letters = extract_recommendation_letters(text)
-rep_flags = detect_repetitive_letters(letters)
-
-for l1, l2, score in rep_flags:
-    print(f"⚠️ Repetition Detected: {l1} ↔ {l2} | Similarity: {score:.2f}")
+        print(f"⚠️ {report_format.upper()} report failed: {e}")
+        return None, "unavailable"
+
+def _report_fields(report_id, report_state, report_format):
+    return {
+        "report_id": report_id,
+        "report_format": report_format,
+        "report_status": report_state,
+        "report_status_url": f"/reports/{report_id}/status" if report_id else None,
+        "report_url": f"/reports/{report_id}.{report_format}" if report_id else None,
+        "pdf_report_path": f"reports/{report_id}.pdf" if report_id and report_format == "pdf" else None
+    }
+
+def _check_report_format(report_format):
+    if report_format not in report_formats:
+        raise HTTPException(status_code=400, detail=f"report_format must be one of {', '.join(report_formats)}")
+
+async def _lookup_cached(document_sha, ext):
+    # ✅ Re-uploads of the same bytes under the same rules and model skip the whole pipeline
+    cache_key = make_key(document_sha, ext, await asyncio.to_thread(analysis_version))
+    text = None
+    with metrics.span("cache_lookup"):
+        cached = await asyncio.to_thread(analysis_cache.get, cache_key)
+        if cached is not None:
+            text = await asyncio.to_thread(analysis_cache.get_text, cache_key) or ""
+    return cache_key, cached, text
+
+async def _analyze_bytes(data, document_sha, ext, previous=None):
+    cache_key, cached, text = await _lookup_cached(document_sha, ext)
+    if cached is not None:
+        return cache_key, cached, text, cached["analysis"]
+
+    # Parsing, segmentation and rule checks run off the event loop
+    text, analysis = await run_cpu_bound(analyze_document_bytes, data, ext, previous)
+    return _analysis_key(document_sha, ext, analysis), None, text, analysis
+
+def _analysis_key(document_sha, ext, analysis):
+    # Keyed by the rules and model the analysis actually used, which differ from the lookup
+    # key when a rule pack was reloaded while it ran
+    return make_key(document_sha, ext, analysis["fingerprints"]["version"])
+
+def _check_letter_index(document_sha, letters, label, replaces=None):
+    # ✅ Compare this filing's letters with every letter analyzed before, then index them.
+    # replaces (the earlier draft's SHA-256) keeps a revision from matching its own letters.
+    with metrics.span("letter_index"):
+        return letter_index.check_and_add(document_sha, letters, label, replaces=replaces)
+
+def _check_analyze_params(file, report_format, previous_analysis_id):
+    _check_report_format(report_format)
+    if previous_analysis_id is not None and not is_valid_key(previous_analysis_id):
+        raise HTTPException(status_code=400, detail="Invalid previous_analysis_id")
+    ext = os.path.splitext(file.filename)[-1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+    return ext
+
+async def _read_document(file):
+    digest = hashlib.sha256()
+    try:
+        with metrics.span("upload_read"):
+            data = await read_upload(file, digest=digest)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return data, digest.hexdigest()
+
+async def _load_previous(previous_analysis_id):
+    # (analysis, document SHA-256) of the earlier draft; either may be None
+    if previous_analysis_id is None:
+        return None, None
+    previous_entry = await asyncio.to_thread(analysis_cache.get, previous_analysis_id)
+    if not previous_entry:
+        return None, None
+    return previous_entry["analysis"], previous_entry.get("document_sha")
+
+async def _finish_analysis(cache_key, cached, text, analysis, document_sha, filename, report_format,
+                           previous_analysis_id, previous, previous_sha, endpoint):
+    # Everything after the pipeline itself: cache, report, letter index and the response body
+    incremental = analysis.pop("incremental", None) if cached is None else None
+    cache_state = "hit" if cached is not None else "miss"
+    if cached is None:
+        # Stored before queueing so the rendered PDF always finds its cache entry
+        report_id = new_report_id()
+        with metrics.span("cache_store"):
+            await asyncio.to_thread(analysis_cache.put, cache_key, text, analysis, report_id, document_sha)
+
+    if report_format != "pdf":
+        report_id, report_state = await asyncio.to_thread(
+            _write_report, analysis, cached.get("report_id") if cached else report_id, report_format
+        )
+    elif cached is not None:
+        with metrics.span("report_restore"):
+            report_id, report_state = await asyncio.to_thread(_restore_report, cache_key, cached)
+    else:
+        with metrics.span("report_queue"):
+            report_id, report_state = _queue_report(cache_key, analysis, report_id)
+    metrics.analyses_total.inc(endpoint=endpoint, cache=cache_state)
+
+    # Same as the batch path, so a letter uploaded on its own is checked and indexed too
+    letters = await asyncio.to_thread(letters_or_whole_document, text, filename)
+    cross_matches = await asyncio.to_thread(_check_letter_index, document_sha, letters, filename, previous_sha)
+
+    content = {
+        **analysis,
+        "cross_petition_letters": cross_matches,
+        "cache": cache_state,
+        "analysis_id": cache_key,
+        **_report_fields(report_id, report_state, report_format)
+    }
+    if previous_analysis_id is not None:
+        content.update(
+            previous_analysis_id=previous_analysis_id,
+            previous_analysis="found" if previous is not None else "not_found",
+            incremental=incremental,
+            diff=diff_findings(previous, analysis) if previous is not None else None,
+        )
+    return content
 
 @app.post("/analyze/")
-async def analyze_eb1a_file(file: UploadFile = File(...)):
+async def analyze_eb1a_file(file: UploadFile = File(...), profile: bool = False, report_format: str = "pdf",
+                            previous_analysis_id: Optional[str] = None):
+    # ?profile=true adds the time spent in each pipeline stage to the response;
+    # ?report_format=html|json returns a report that is ready immediately instead of a queued PDF;
+    # ?previous_analysis_id=<analysis_id of an earlier draft> rechecks only the sections that
+    # changed and adds a diff of the findings
     try:
-        ext = os.path.splitext(file.filename)[-1].lower()
-        if ext not in [".pdf", ".docx", ".txt"]:
-            raise HTTPException(status_code=400, detail="Unsupported file format")
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp:
-            temp.write(await file.read())
-            temp_path = temp.name
-
-        text = load_document(temp_path)
-        os.remove(temp_path)
-
-        segments = segment_by_criterion(text)
-        all_findings = []
-
-        for header, content in segments.items():
-            findings = apply_advanced_rule_based_check(content)
-            all_findings.extend(findings)
-
-        letters = extract_recommendation_letters(text)
-        rep_flags = detect_repetitive_letters(letters)
-
-        # ✅ Generate the PDF report
-        pdf_path = generate_pdf_report({
-            "rule_based_findings": all_findings,
-            "repetitive_letters": [
-                {"letter_1": l1, "letter_2": l2, "similarity": score}
-                for l1, l2, score in rep_flags
-            ]
-        })
-
-        print("✅ PDF saved at:", pdf_path)
-
-        relative_pdf_path = os.path.join("reports", os.path.basename(pdf_path))
+        with metrics.request_profile(profile) as request_profile:
+            ext = _check_analyze_params(file, report_format, previous_analysis_id)
+            data, document_sha = await _read_document(file)
+            previous, previous_sha = await _load_previous(previous_analysis_id)
+            cache_key, cached, text, analysis = await _analyze_bytes(data, document_sha, ext, previous)
+            content = await _finish_analysis(
+                cache_key, cached, text, analysis, document_sha, file.filename, report_format,
+                previous_analysis_id, previous, previous_sha, "analyze",
+            )
+        if request_profile is not None:
+            content["profile"] = metrics.profile_summary(request_profile)
+        return JSONResponse(content=content)
+
+    except HTTPException:
+        raise
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
-        return JSONResponse(content={
-            "rule_based_findings": all_findings,
-            "repetitive_letters": [
-                {"letter_1": l1, "letter_2": l2, "similarity": score}
-                for l1, l2, score in rep_flags
-            ],
-            "pdf_report_path": relative_pdf_path
-        })
+#Streaming
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _cached_events(analysis):
+    # The events a fresh run would have sent, replayed from a cached analysis
+    by_section = {}
+    for finding in analysis.get("rule_based_findings", []):
+        by_section.setdefault(finding.get("section"), []).append(finding)
+    for header in analysis.get("fingerprints", {}).get("sections", by_section):
+        yield "section", {"section": header, "findings": by_section.get(header, []), "reused": True}
+    yield "findings", {"rule_based_findings": analysis.get("rule_based_findings", [])}
+    yield "letters", {"repetitive_letters": analysis.get("repetitive_letters", [])}
+
+async def _stream_analysis(queue, data, document_sha, ext, filename, report_format, previous_analysis_id):
+    # Fills `queue` with SSE frames and ends it with None. Runs as its own task, so the
+    # analysis finishes (and releases its admission slot) even if the client goes away.
+    loop = asyncio.get_running_loop()
+
+    def produce():
+        # Frames are serialized here, before later stages add to the same finding dicts
+        for event, payload in analysis_events(document_chunks(data, ext), previous):
+            if event == "result":
+                return payload
+            loop.call_soon_threadsafe(queue.put_nowait, _sse(event, payload))
 
+    try:
+        queue.put_nowait(_sse("accepted", {"filename": filename, "bytes": len(data)}))
+        previous, previous_sha = await _load_previous(previous_analysis_id)
+        cache_key, cached, text = await _lookup_cached(document_sha, ext)
+        if cached is not None:
+            analysis = cached["analysis"]
+            for event, payload in _cached_events(analysis):
+                queue.put_nowait(_sse(event, payload))
+        else:
+            # Always a thread, even with EB1A_EXECUTOR=process: events must reach this loop as they happen
+            text, analysis = await asyncio.to_thread(produce)
+            cache_key = _analysis_key(document_sha, ext, analysis)
+        content = await _finish_analysis(
+            cache_key, cached, text, analysis, document_sha, filename, report_format,
+            previous_analysis_id, previous, previous_sha, "stream",
+        )
+        queue.put_nowait(_sse("report", _report_fields(content["report_id"], content["report_status"], report_format)))
+        queue.put_nowait(_sse("done", content))
+    except DocumentTooLarge as e:
+        queue.put_nowait(_sse("error", {"status": 413, "detail": str(e)}))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+        queue.put_nowait(_sse("error", {"status": 500, "detail": f"Processing error: {str(e)}"}))
+    finally:
+        queue.put_nowait(None)
+
+# The event loop only keeps weak references to tasks
+_stream_tasks = set()
+
+def _stream_task_done(task):
+    _stream_tasks.discard(task)
+    analysis_slots.release()
+
+async def _drain(queue):
+    while True:
+        frame = await queue.get()
+        if frame is None:
+            return
+        yield frame
+
+@app.post("/analyze/stream")
+async def analyze_eb1a_stream(request: Request, file: UploadFile = File(...), report_format: str = "pdf",
+                              previous_analysis_id: Optional[str] = None):
+    # ✅ Server-sent events: accepted, page (per extracted page), section (per criterion, as soon
+    # as its rule checks finish), findings (with classifier scores), letters, report, then done
+    # with the same body /analyze/ returns. Failures after the stream starts arrive as an error event.
+    ext = _check_analyze_params(file, report_format, previous_analysis_id)
+    data, document_sha = await _read_document(file)
+
+    queue = asyncio.Queue()
+    task = asyncio.create_task(
+        _stream_analysis(queue, data, document_sha, ext, file.filename, report_format, previous_analysis_id)
+    )
+    # The admission slot now belongs to the analysis task rather than to this request
+    request.state.keeps_admission_slot = True
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_task_done)
+    return StreamingResponse(
+        _drain(queue), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _analyze_batch_member(filename, data):
+    started = time.perf_counter()
+    result = {"filename": filename, "bytes": len(data)}
+    ext = os.path.splitext(filename)[-1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        result.update(status="skipped", error="Unsupported file format")
+        return result, []
 
-# ✅ GET endpoint for PDF file
-@app.get("/reports/{filename}")
-def get_pdf(filename: str):
-    file_path = os.path.join(os.getcwd(), "reports", filename)
+    try:
+        document_sha = hashlib.sha256(data).hexdigest()
+        cache_key, cached, text, analysis = await _analyze_bytes(data, document_sha, ext)
+        if cached is None:
+            with metrics.span("cache_store"):
+                await asyncio.to_thread(analysis_cache.put, cache_key, text, analysis, None, document_sha)
+        metrics.analyses_total.inc(endpoint="batch", cache="hit" if cached is not None else "miss")
+        letters = await asyncio.to_thread(letters_or_whole_document, text, filename)
+        cross_matches = await asyncio.to_thread(_check_letter_index, document_sha, letters, filename)
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result, []
+
+    result.update(
+        status="ok",
+        cache="hit" if cached is not None else "miss",
+        analysis_id=cache_key,
+        letters=len(letters),
+        rule_based_findings=analysis["rule_based_findings"],
+        repetitive_letters=analysis["repetitive_letters"],
+        cross_petition_letters=cross_matches,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+    # Letters are labelled by file so repetition across the set names its source
+    return result, [(f"{filename}: {header}" if header != filename else filename, body) for header, body in letters]
+
+@app.post("/analyze/batch/")
+async def analyze_eb1a_batch(files: List[UploadFile] = File(...), report_format: str = "pdf"):
+    # A whole filing at once: petition and letters as separate files and/or zip archives
+    started = time.perf_counter()
+    _check_report_format(report_format)
+    try:
+        uploads = []
+        remaining = workers.max_batch_bytes
+        for file in files:
+            data = await read_upload(file, limit=remaining)
+            remaining -= len(data)
+            uploads.append((file.filename, data))
+        members = await asyncio.to_thread(expand_zip_uploads, uploads, SUPPORTED_EXTENSIONS)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive: {e}")
+    if not members:
+        raise HTTPException(status_code=400, detail="No supported documents in the upload")
+
+    outcomes = await asyncio.gather(*(_analyze_batch_member(name, data) for name, data in members))
+    results = [result for result, _ in outcomes]
+    all_letters = [letter for _, letters in outcomes for letter in letters]
+
+    all_findings = []
+    for result in results:
+        for finding in result.get("rule_based_findings", []):
+            all_findings.append({**finding, "source": result["filename"]})
+    rep_flags = await run_cpu_bound(find_repetitive_letters, all_letters)
+
+    combined = {"rule_based_findings": all_findings, "repetitive_letters": rep_flags}
+    if report_format != "pdf":
+        report_id, report_state = await asyncio.to_thread(_write_report, combined, new_report_id(), report_format)
+    else:
+        try:
+            report_id, report_state = submit_report(combined), "queued"
+        except ReportQueueFull as e:
+            print("⚠️ Report not queued:", e)
+            report_id, report_state = None, "unavailable"
+
+    return JSONResponse(content={
+        **combined,
+        "files": results,
+        **_report_fields(report_id, report_state, report_format),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+# Classifier artifact is trained offline (`python classifier.py train`) and loaded on first use
+@app.get("/model/")
+def model_info():
+    try:
+        return classifier_info()
+    except ModelArtifactError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/rules/")
+def rules_info():
+    return active_pack().info()
+
+@app.post("/admin/rules/reload")
+def reload_rules(x_admin_token: Optional[str] = Header(None)):
+    # Recompiles the rule pack file and swaps it in; requests already running finish on the
+    # old pack. With several server workers this reloads only the one answering, and the
+    # others follow within EB1A_RULES_WATCH_SECONDS.
+    if not admin_token or not secrets.compare_digest(x_admin_token or "", admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    try:
+        previous = active_pack().version
+        pack = reload_rule_pack()
+    except RulePackError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**pack.info(), "previous_version": previous}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return analysis_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    # Prometheus text format; each server process reports its own counters
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/letter-index/stats")
+def letter_index_stats():
+    return letter_index.stats()
+
+@app.get("/precedents/stats")
+def precedent_index_stats():
+    return get_precedent_index().stats()
+
+def _report_id_from_path(report_id):
+    # "<id>", "<id>.pdf", "<id>.html" or "<id>.json"; a bare id means the PDF
+    report_id, _, fmt = report_id.partition(".")
+    fmt = fmt or "pdf"
+    if not is_valid_report_id(report_id) or fmt not in report_formats:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report_id, fmt
+
+@app.get("/reports/{report_id}/status")
+def get_report_status(report_id: str):
+    status = report_status(_report_id_from_path(report_id)[0])
+    if status is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return status
+
+# ✅ GET endpoint for report files
+@app.get("/reports/{report_id}")
+def get_pdf(report_id: str):
+    report_id, fmt = _report_id_from_path(report_id)
+    file_path = report_path(report_id, fmt)
     if os.path.exists(file_path):
-        return FileResponse(path=file_path, media_type="application/pdf", filename=filename)
-    raise HTTPException(status_code=404, detail="Report not found")
+        return FileResponse(path=file_path, media_type=media_types[fmt], filename=f"{report_id}.{fmt}")
+
+    # Only PDFs render in the background; a missing HTML or JSON report does not exist, and
+    # neither does a PDF that is not queued, rendering or failed (e.g. the id of an HTML report)
+    status = report_status(report_id, fmt) if fmt == "pdf" else None
+    if status is None or status["status"] == "done":
+        raise HTTPException(status_code=404, detail="Report not found")
+    if status["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Report rendering failed: {status.get('error')}")
+    return JSONResponse(status_code=202, content=status)
 
 #Entry Point
 
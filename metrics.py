@@ -0,0 +1,201 @@
+import time
+import threading
+import contextvars
+
+from contextlib import contextmanager
+
+
+# Observations made while a collector is active (inside executor and report workers) are
+# returned to the server process and replayed there with record(), so they land in the
+# server's registry even when the work ran in another process.
+_collector = contextvars.ContextVar("eb1a_metrics_collector", default=None)
+# Stage timings for the current request when it asked for ?profile=true
+_profile = contextvars.ContextVar("eb1a_request_profile", default=None)
+
+_registry = {}
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+#Metric Types
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(float(bound)))])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class Callback:
+    # A gauge or counter whose values are read from elsewhere at scrape time.
+    # `read` returns a number, or {label_value: number} when labelname is set.
+
+    def __init__(self, name, documentation, read, kind="gauge", labelname=None):
+        self.name, self.documentation, self.read = name, documentation, read
+        self.kind, self.labelname = kind, labelname
+        _registry[name] = self
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.read()
+        except Exception:
+            return lines
+        if self.labelname is None:
+            lines.append(f"{self.name} {values}")
+        else:
+            for label, value in sorted(values.items()):
+                lines.append(f"{self.name}{_format_labels((self.labelname,), (str(label),))} {value}")
+        return lines
+
+
+#Pipeline Metrics
+stage_seconds = Histogram(
+    "eb1a_stage_duration_seconds", "Time spent in each analysis pipeline stage.",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120), ("stage",),
+)
+document_pages = Histogram(
+    "eb1a_document_pages", "Pages per analyzed PDF.", (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000),
+)
+document_bytes = Histogram(
+    "eb1a_document_bytes", "Size of each uploaded document.",
+    (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8), ("format",),
+)
+sections_found = Histogram(
+    "eb1a_sections_found", "Criterion sections found per document.", (0, 1, 2, 3, 5, 10, 20, 50),
+)
+analyses_total = Counter(
+    "eb1a_analyses_total", "Documents analyzed, by endpoint and result cache outcome.", ("endpoint", "cache"),
+)
+requests_total = Counter(
+    "eb1a_http_requests_total", "HTTP requests by route and status code.", ("route", "status"),
+)
+
+
+def observe(name, value, **labels):
+    collector = _collector.get()
+    if collector is not None:
+        collector.append((name, value, labels))
+        return
+    _registry[name].observe(value, **labels)
+    profile = _profile.get()
+    if profile is not None and name == stage_seconds.name:
+        profile.append((labels["stage"], value))
+
+def observe_stage(stage, seconds):
+    observe(stage_seconds.name, seconds, stage=stage)
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+#Cross-Process Collection
+@contextmanager
+def collect():
+    observations = []
+    token = _collector.set(observations)
+    try:
+        yield observations
+    finally:
+        _collector.reset(token)
+
+def record(observations):
+    for name, value, labels in observations:
+        observe(name, value, **labels)
+
+def call_collected(func, *args, **kwargs):
+    # Runs func and returns (result, observations) so they can cross a process boundary
+    with collect() as observations:
+        result = func(*args, **kwargs)
+    return result, observations
+
+
+#Request Profiles
+@contextmanager
+def request_profile(enabled=True):
+    if not enabled:
+        yield None
+        return
+    spans = []
+    token = _profile.set(spans)
+    started = time.perf_counter()
+    profile = {"spans": spans}
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+        profile["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+def profile_summary(profile):
+    stages = {}
+    for stage, seconds in profile["spans"]:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+    return {
+        "total_ms": profile.get("total_ms"),
+        "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+    }
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
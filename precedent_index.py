@@ -0,0 +1,355 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from analyzer import SUPPORTED_EXTENSIONS, normalize, load_document, segment_document
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+index_dir = os.environ.get("EB1A_PRECEDENT_INDEX_DIR", os.path.join(base_dir, "precedent_index"))
+# Precedent excerpts attached to each finding
+top_k = int(os.environ.get("EB1A_PRECEDENTS_K", "3"))
+# Passages scoring below this cosine similarity are not worth showing
+min_similarity = float(os.environ.get("EB1A_PRECEDENT_MIN_SIMILARITY", "0.1"))
+
+passage_words = 150
+excerpt_chars = 300
+# Adding a segment past this many merges them all, so queries stay one product per few segments
+max_segments = int(os.environ.get("EB1A_PRECEDENT_MAX_SEGMENTS", "8"))
+
+# Stateless, so passages added later are comparable with earlier ones without refitting
+_vectorizer = HashingVectorizer(
+    n_features=1 << 18, alternate_sign=False, norm="l2", stop_words="english", ngram_range=(1, 2), dtype=np.float32,
+)
+
+
+#Decision Passages
+# AAO decisions discuss each criterion after citing it. The ten criteria of
+# 8 C.F.R. § 204.5(h)(3)(i)-(x) are, in order, Criterion 1-10 of the rule pack.
+criterion_citation_pattern = re.compile(r"204\.5\s*\(h\)\s*\(3\)\s*\((x|ix|viii|vii|vi|v|iv|iii|ii|i)\)", re.IGNORECASE)
+criterion_number_pattern = re.compile(r"Criterion\s+(\d+)", re.IGNORECASE)
+_roman = {"i": 1, "ii": 2, "iii": 3, "iv": 4, "v": 5, "vi": 6, "vii": 7, "viii": 8, "ix": 9, "x": 10}
+
+def criterion_discussions(text):
+    # [(criterion, start, end)] spans of the text that discuss one criterion. Petitions with
+    # "Criterion N:" headers use those; decisions run from one criterion citation to the
+    # next citation of a different criterion. Text before the first one is procedural.
+    sections = segment_document(text, ("criterion",))["criterion"]
+    if sections:
+        return [
+            (f"Criterion {criterion_number_pattern.match(section.header).group(1)}", section.start, section.end)
+            for section in sections
+        ]
+    spans = []
+    for match in criterion_citation_pattern.finditer(text):
+        criterion = f"Criterion {_roman[match.group(1).lower()]}"
+        if spans and spans[-1][0] == criterion:
+            continue
+        if spans:
+            spans[-1][2] = match.start()
+        spans.append([criterion, match.start(), len(text)])
+    return [tuple(span) for span in spans]
+
+def decision_passages(text):
+    # (criterion, start offset, passage) in chunks of about passage_words words
+    passages = []
+    for criterion, start, end in criterion_discussions(text):
+        words = list(re.finditer(r"\S+", text[start:end]))
+        for i in range(0, len(words), passage_words):
+            chunk = words[i:i + passage_words]
+            passages.append((criterion, start + chunk[0].start(), text[start + chunk[0].start():start + chunk[-1].end()]))
+    return passages
+
+
+class PrecedentIndex:
+    # Criterion-level passages of AAO decisions as append-only segments on disk. Each segment
+    # is a directory holding an inverted index and the passages' metadata: the sorted hashed
+    # term ids that occur in the segment (terms.npy), and one posting list per such term as
+    # the three CSR arrays of a terms × passages matrix. Only terms present get a row, so a
+    # segment's size follows its passages rather than the 2**18 hash space.
+    #
+    # The arrays are memory-mapped, never read in full: a query only touches the posting
+    # lists of its own terms, and every process serving queries shares the same page cache.
+    # Each `add` writes one new segment; other processes pick it up on their next query.
+    # Past max_segments the segments are merged into one.
+
+    def __init__(self, directory=index_dir):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._segments = []
+        self._names = set()
+        self._seen = set()
+
+    #Segments
+    def _segment_names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("segment-"))
+
+    def _load_segment(self, name):
+        path = os.path.join(self.directory, name)
+        with open(os.path.join(path, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{part}.npy"), mmap_mode="r") for part in ("data", "indices", "indptr")]
+        terms = np.load(os.path.join(path, "terms.npy"))
+        postings = csr_matrix(tuple(arrays), shape=(len(terms), len(records)), copy=False)
+        # Passage ids per criterion, so a finding is only compared with the same criterion
+        by_criterion = {}
+        for i, record in enumerate(records):
+            by_criterion.setdefault(record["criterion"], []).append(i)
+        by_criterion = {criterion: np.array(ids) for criterion, ids in by_criterion.items()}
+        self._segments.append((name, records, (terms, postings), by_criterion))
+        self._names.add(name)
+        self._seen.update(record["sha256"] for record in records)
+
+    def refresh(self):
+        names = self._segment_names()
+        if any(name not in names for name in self._names):
+            # Segments were compacted by another process; start from the new files
+            self._reset()
+        for name in names:
+            if name not in self._names:
+                self._load_segment(name)
+
+    def _write_segment(self, records, vectors):
+        # vectors: passages × n_features
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"segment-{time.time_ns():020d}-{os.getpid()}"
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=f".{name}.")
+        vectors = csr_matrix(vectors)
+        terms = np.unique(vectors.indices).astype(np.int32)
+        local = csr_matrix(
+            (vectors.data, np.searchsorted(terms, vectors.indices), vectors.indptr), shape=(vectors.shape[0], len(terms)),
+        )
+        postings = local.T.tocsr()
+        postings.sort_indices()
+        np.save(os.path.join(staging, "terms.npy"), terms)
+        np.save(os.path.join(staging, "data.npy"), postings.data.astype(np.float32))
+        np.save(os.path.join(staging, "indices.npy"), postings.indices.astype(np.int32))
+        np.save(os.path.join(staging, "indptr.npy"), postings.indptr.astype(np.int32))
+        with open(os.path.join(staging, "records.json"), "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(staging, os.path.join(self.directory, name))
+        return name
+
+    @staticmethod
+    def _segment_vectors(terms, postings):
+        # The segment's passages × n_features matrix, for merging segments
+        local = postings.T.tocsr()
+        return csr_matrix(
+            (np.asarray(local.data), terms[local.indices], local.indptr), shape=(local.shape[0], _vectorizer.n_features),
+        )
+
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(os.path.join(self.directory, ".lock"), "w")
+
+    #Adding
+    def add_document(self, text, source, sha256=None):
+        # Returns the number of passages added; a decision already indexed adds nothing
+        return self.add_documents([(text, source, sha256)])
+
+    def add_documents(self, documents):
+        # documents: [(text, source, sha256 or None)], written as one segment. Returns the
+        # number of passages added; decisions already indexed are skipped.
+        records, texts = [], []
+        with self._lock:
+            self.refresh()
+            seen = set(self._seen)
+        for text, source, sha256 in documents:
+            sha256 = sha256 or hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if sha256 in seen:
+                continue
+            seen.add(sha256)
+            for criterion, start, passage in decision_passages(text):
+                texts.append(normalize(passage))
+                records.append({
+                    "source": source, "sha256": sha256, "criterion": criterion, "start": start,
+                    "excerpt": passage[:excerpt_chars] + "..." if len(passage) > excerpt_chars else passage,
+                })
+        if not records:
+            return 0
+        vectors = _vectorizer.transform(texts)
+
+        with self._lock, self._write_lock() as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Checked again under the file lock, in case another process added some meanwhile
+            self.refresh()
+            keep = [i for i, record in enumerate(records) if record["sha256"] not in self._seen]
+            if not keep:
+                return 0
+            records = [records[i] for i in keep]
+            name = self._write_segment(records, vectors[keep])
+            self._load_segment(name)
+            if len(self._segments) > max_segments:
+                self._compact()
+        return len(records)
+
+    #Queries
+    def search(self, texts, criteria, k=top_k):
+        # texts[i] is a section and criteria[i] the criteria it matched. Returns one
+        # {criterion: [precedent, ...]} per text with the k most similar passages from
+        # decisions discussing that criterion. Every text is vectorized in one batch and
+        # scored against each segment with one sparse product.
+        results = [{criterion: [] for criterion in wanted} for wanted in criteria]
+        if not texts:
+            return results
+        queries = _vectorizer.transform([normalize(text) for text in texts])
+        with self._lock:
+            self.refresh()
+            segments = list(self._segments)
+
+        candidates = [{criterion: [] for criterion in wanted} for wanted in criteria]
+        for _, records, (terms, postings), by_criterion in segments:
+            if not terms.size:
+                # Only stop words were indexed; nothing here can score
+                continue
+            # Query terms as rows of this segment's postings; terms it lacks score nothing
+            rows = np.minimum(np.searchsorted(terms, queries.indices), len(terms) - 1)
+            present = terms[rows] == queries.indices
+            local = csr_matrix(
+                (queries.data * present, rows, queries.indptr), shape=(queries.shape[0], len(terms)),
+            )
+            scores = (local @ postings).toarray()
+            for row, wanted in enumerate(criteria):
+                for criterion in wanted:
+                    ids = by_criterion.get(criterion)
+                    if ids is None:
+                        continue
+                    best = ids[np.argsort(-scores[row, ids], kind="stable")[:k]]
+                    candidates[row][criterion].extend(
+                        (float(scores[row, i]), records[i]) for i in best if scores[row, i] >= min_similarity
+                    )
+
+        for row, by_criterion in enumerate(candidates):
+            for criterion, found in by_criterion.items():
+                found.sort(key=lambda item: -item[0])
+                results[row][criterion] = [
+                    {
+                        "source": record["source"],
+                        "excerpt": record["excerpt"],
+                        "start": record["start"],
+                        "similarity": round(score, 4),
+                    }
+                    for score, record in found[:k]
+                ]
+        return results
+
+    def compact(self):
+        # Merge every segment into one; safe while other processes keep querying
+        with self._lock, self._write_lock() as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._reset()
+            self.refresh()
+            self._compact()
+
+    def _compact(self):
+        # Called with both locks held and the segments refreshed
+        if len(self._segments) < 2:
+            return
+        old_names = [name for name, _, _, _ in self._segments]
+        records = [record for _, segment_records, _, _ in self._segments for record in segment_records]
+        vectors = vstack([self._segment_vectors(*postings) for _, _, postings, _ in self._segments]).tocsr()
+        self._write_segment(records, vectors)
+        for old in old_names:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+        self._reset()
+        self.refresh()
+
+    def stats(self):
+        with self._lock:
+            self.refresh()
+            criteria = {}
+            for _, records, _, _ in self._segments:
+                for record in records:
+                    criteria[record["criterion"]] = criteria.get(record["criterion"], 0) + 1
+            return {
+                "passages": sum(len(records) for _, records, _, _ in self._segments),
+                "decisions": len(self._seen),
+                "segments": len(self._segments),
+                "passages_by_criterion": dict(sorted(criteria.items(), key=lambda item: int(item[0].split()[-1]))),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_precedent_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PrecedentIndex()
+    return _index
+
+
+#Entry Point
+def _iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the AAO precedent index.")
+    parser.add_argument("--dir", default=index_dir, help="index directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="index the decisions in files or directories")
+    add.add_argument("paths", nargs="+")
+    search = subparsers.add_parser("search", help="show the precedents closest to a passage")
+    search.add_argument("criterion", help='e.g. "Criterion 3"')
+    search.add_argument("text")
+    search.add_argument("-k", type=int, default=top_k)
+    subparsers.add_parser("compact", help="merge all segments into one")
+    subparsers.add_parser("stats", help="show index size")
+    args = parser.parse_args(argv)
+
+    index = PrecedentIndex(args.dir)
+    if args.command == "add":
+        documents = []
+        for path in _iter_files(args.paths):
+            try:
+                documents.append((load_document(path), os.path.basename(path), None))
+            except Exception as e:
+                print(f"⚠️ Skipping {path}: {e}")
+        # One segment for the whole call
+        started = time.perf_counter()
+        added = index.add_documents(documents)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"📄 {len(documents)} decisions: {added} passages added ({elapsed:.0f} ms)")
+    elif args.command == "search":
+        started = time.perf_counter()
+        precedents = index.search([args.text], [[args.criterion]], args.k)[0][args.criterion]
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"🔎 {len(precedents)} precedents ({elapsed:.1f} ms)")
+        for precedent in precedents:
+            print(f" - {precedent['source']} | Similarity: {precedent['similarity']:.2f}\n   {precedent['excerpt']}")
+    elif args.command == "compact":
+        index.compact()
+        print(json.dumps(index.stats(), indent=2))
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,141 +1,165 @@
 import os
+import re
+import uuid
+import json
 import datetime
-from weasyprint import HTML, CSS
+import tempfile
 
-def generate_pdf_report(data):
-    # Prepare directory
-    reports_dir = os.path.join(os.getcwd(), "reports")
-    os.makedirs(reports_dir, exist_ok=True)
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+import metrics
+
+reports_dir = os.environ.get("EB1A_REPORTS_DIR", os.path.join(os.getcwd(), "reports"))
+
+_report_id_pattern = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def new_report_id():
+    return uuid.uuid4().hex
+
+def is_valid_report_id(report_id):
+    return bool(_report_id_pattern.fullmatch(report_id or ""))
+
+# PDFs go through WeasyPrint in the report workers; HTML and JSON are quick enough to
+# write in the request and never load WeasyPrint at all
+report_formats = ("pdf", "html", "json")
+media_types = {"pdf": "application/pdf", "html": "text/html", "json": "application/json"}
+
+template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+recommendation_text = (
+    "Consider rephrasing the excerpt to explicitly state the impact, significance, "
+    "or national/international recognition."
+)
+
+
+def report_path(report_id, fmt="pdf"):
+    if not is_valid_report_id(report_id):
+        raise ValueError(f"Invalid report id: {report_id!r}")
+    if fmt not in report_formats:
+        raise ValueError(f"Unsupported report format: {fmt!r}")
+    return os.path.join(reports_dir, f"{report_id}.{fmt}")
+
+
+#Template and Stylesheet
+# Compiled on first use and kept for the life of the process
+_template = None
+_css_text = None
+_stylesheet = None
+
+def _get_template():
+    global _template, _css_text
+    if _template is None:
+        environment = Environment(loader=FileSystemLoader(template_dir), autoescape=select_autoescape(["html"]))
+        with open(os.path.join(template_dir, "report.css"), "r", encoding="utf-8") as f:
+            _css_text = f.read()
+        _template = environment.get_template("report.html")
+    return _template
+
+def _get_stylesheet():
+    global _stylesheet
+    if _stylesheet is None:
+        from weasyprint import CSS
+        _get_template()
+        _stylesheet = CSS(string=_css_text)
+    return _stylesheet
 
-    filename = "eb1a_risk_report.pdf"
-    filepath = os.path.join(reports_dir, filename)
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
 
+def warm_up(stylesheet=True):
+    # Report worker initializer: parse the template and stylesheet before the first job arrives.
+    # The web server only renders HTML and JSON itself, so it skips the WeasyPrint stylesheet.
+    _get_template()
+    if stylesheet:
+        _get_stylesheet()
+
+
+#Report Context
+def risk_level(issues):
+    if len(issues) > 3:
+        return "High"
+    elif len(issues) == 2 or len(issues) == 3:
+        return "Medium"
+    return "Low"
+
+def build_report_context(data):
+    # Everything the report shows, as plain data: rendered by the template or returned as JSON
     findings = data.get("rule_based_findings", [])
-    repetitions = data.get("repetitive_letters", [])
-
-    # Start HTML
-    html = f"""
-    <html>
-        <head>
-            <style>
-                body {{
-                    font-family: 'Segoe UI', sans-serif;
-                    padding: 40px;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                h1, h2 {{
-                    color: #003366;
-                }}
-                .low {{ color: green; font-weight: bold; }}
-                .medium {{ color: orange; font-weight: bold; }}
-                .high {{ color: red; font-weight: bold; }}
-                .excerpt {{
-                    font-style: italic;
-                    background-color: #f1f1f1;
-                    padding: 10px;
-                    margin: 10px 0;
-                    border-left: 4px solid #ccc;
-                }}
-                .recommendation {{
-                    background-color: #e7f3fe;
-                    padding: 10px;
-                    border-left: 4px solid #2196F3;
-                    margin-bottom: 20px;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin-bottom: 20px;
-                }}
-                th, td {{
-                    border: 1px solid #ccc;
-                    padding: 8px;
-                    text-align: left;
-                }}
-                th {{
-                    background-color: #f2f2f2;
-                }}
-                .toc li {{
-                    margin-bottom: 5px;
-                }}
-            </style>
-        </head>
-        <body>
-            <h1>EB-1A RFE Risk Assessment Report</h1>
-            <p><strong>Date:</strong> {now}</p>
-
-            <h2>📘 Table of Contents</h2>
-            <ul class="toc">
-                <li>📊 Risk Matrix</li>
-                <li>🧠 Rule-Based Findings</li>
-                <li>⚠️ Repetitive Letters</li>
-                <li>✅ Recommendations</li>
-            </ul>
-
-            <h2>📊 Risk Matrix</h2>
-            <table>
-                <tr>
-                    <th>Criterion</th>
-                    <th>Risk Level</th>
-                    <th>Issues Detected</th>
-                </tr>
-    """
-
-    # Risk Matrix
-    for item in findings:
-        criterion = item['matched_criterion']
-        issues = item['issues']
-        if len(issues) > 3:
-            risk = '<span class="high">High</span>'
-        elif len(issues) == 2 or len(issues) == 3:
-            risk = '<span class="medium">Medium</span>'
-        else:
-            risk = '<span class="low">Low</span>'
-
-        html += f"""
-        <tr>
-            <td>{criterion}</td>
-            <td>{risk}</td>
-            <td>{len(issues)}</td>
-        </tr>
-        """
-
-    html += "</table>"
-
-    # Rule-Based Findings
-    html += "<h2>🧠 Rule-Based Findings</h2>"
-    if findings:
-        for item in findings:
-            html += f"<h3>{item['matched_criterion']}</h3>"
-            html += f"<p class='excerpt'>{item['excerpt']}</p>"
-            html += "<ul>"
-            for issue in item["issues"]:
-                html += f"<li>{issue}</li>"
-            html += "</ul>"
-    else:
-        html += "<p>No rule-based issues found.</p>"
-
-    # Repetitive Letters
-    html += "<h2>⚠️ Repetitive Recommendation Letters</h2>"
-    if repetitions:
-        html += "<ul>"
-        for rep in repetitions:
-            html += f"<li>{rep['letter_1']} ↔ {rep['letter_2']} — Similarity: {rep['similarity']:.2f}</li>"
-        html += "</ul>"
-    else:
-        html += "<p>No significant repetition detected.</p>"
-
-    # Recommendations
-    html += "<h2>✅ Editable Recommendations</h2>"
-    if findings:
-        for item in findings:
-            html += f"<div class='recommendation'><strong>Fix for {item['matched_criterion']}:</strong><br/><em>“Consider rephrasing the excerpt to explicitly state the impact, significance, or national/international recognition.”</em></div>"
-    else:
-        html += "<p>None needed. Looks great!</p>"
-
-    html += "</body></html>"
-
-    HTML(string=html).write_pdf(filepath)
+    return {
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "findings": [
+            {
+                "criterion": item["matched_criterion"],
+                "risk": risk_level(item["issues"]),
+                "issues": item["issues"],
+                "excerpt": item["excerpt"],
+                "strength_probability": item.get("strength_probability"),
+                "precedents": item.get("precedents", []),
+                **({"source": item["source"]} if "source" in item else {}),
+            }
+            for item in findings
+        ],
+        "repetitions": [
+            {
+                "letter_1": rep["letter_1"],
+                "letter_2": rep["letter_2"],
+                "similarity": rep["similarity"],
+                "passages": rep.get("overlapping_passages", [])[:2],
+            }
+            for rep in data.get("repetitive_letters", [])
+        ],
+        "recommendations": [
+            {"criterion": item["matched_criterion"], "text": recommendation_text} for item in findings
+        ],
+    }
+
+def render_report_html(context, inline_css=True):
+    # The PDF path passes the stylesheet to WeasyPrint pre-parsed instead of inlining it
+    template = _get_template()
+    return template.render(**context, inline_css=_css_text if inline_css else None)
+
+
+#Rendering
+def _write_atomic(filepath, write):
+    # Write next to the target and rename, so a half-written report is never served.
+    # The temporary name is unique, so concurrent writers of one report never share it.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=f".{os.path.basename(filepath)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _write_text(text):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return write
+
+def generate_report(data, report_id=None, fmt="pdf"):
+    os.makedirs(reports_dir, exist_ok=True)
+    # Every analysis writes its own file so concurrent users never overwrite each other
+    filepath = report_path(report_id or new_report_id(), fmt)
+
+    with metrics.span("report_context"):
+        context = build_report_context(data)
+
+    if fmt == "json":
+        with metrics.span("report_json"):
+            _write_atomic(filepath, _write_text(json.dumps(context, ensure_ascii=False, indent=2)))
+        return filepath
+
+    with metrics.span("report_html"):
+        html = render_report_html(context, inline_css=fmt == "html")
+    if fmt == "html":
+        _write_atomic(filepath, _write_text(html))
+        return filepath
+
+    from weasyprint import HTML
+    stylesheet = _get_stylesheet()
+    with metrics.span("report_pdf"):
+        _write_atomic(filepath, lambda path: HTML(string=html).write_pdf(path, stylesheets=[stylesheet]))
     return filepath
+
+def generate_pdf_report(data, report_id=None):
+    return generate_report(data, report_id, "pdf")
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import multiprocessing
+
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from report_generator import generate_pdf_report, new_report_id, report_formats, report_path, reports_dir, warm_up
+
+
+# WeasyPrint is CPU-bound and holds the GIL, so reports render in worker processes
+max_workers = int(os.environ.get("EB1A_REPORT_WORKERS", "2"))
+# Jobs waiting or rendering at once; beyond this new reports are rejected
+max_pending = int(os.environ.get("EB1A_REPORT_QUEUE_SIZE", "32"))
+# Finished jobs remembered for status lookups (the PDF itself stays on disk)
+max_tracked = int(os.environ.get("EB1A_REPORT_JOBS_TRACKED", "1000"))
+# A queued or rendering job whose state file has not changed for this long is treated as
+# failed (its server worker died with it)
+job_timeout = int(os.environ.get("EB1A_REPORT_JOB_TIMEOUT", "900"))
+
+
+class ReportQueueFull(RuntimeError):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_pending = 0
+
+
+#Shared Job State
+# Jobs live in the memory of the server worker that queued them. Their state is also
+# written next to the reports, so with several server workers any of them can answer
+# a status poll. The file is removed once the report itself exists.
+def _job_state_path(report_id):
+    return os.path.join(reports_dir, f"{report_id}.job.json")
+
+def _save_job_state(report_id, status, created_at, error=None):
+    state = {"status": status, "created_at": created_at, "updated_at": time.time()}
+    if error is not None:
+        state["error"] = error
+    tmp_path = None
+    try:
+        os.makedirs(reports_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=reports_dir, prefix=f".{report_id}.job.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, _job_state_path(report_id))
+    except OSError as e:
+        print(f"⚠️ Could not record report {report_id} state: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _load_job_state(report_id):
+    try:
+        with open(_job_state_path(report_id), "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state["status"] in ("queued", "rendering") and time.time() - state["updated_at"] > job_timeout:
+        state.update(status="failed", error=f"No progress for {job_timeout}s; the worker rendering it stopped")
+    return state
+
+def _clear_job_state(report_id):
+    try:
+        os.remove(_job_state_path(report_id))
+    except OSError:
+        pass
+
+def _render(data, report_id, created_at):
+    # Runs in a render process
+    _save_job_state(report_id, "rendering", created_at)
+    return metrics.call_collected(generate_pdf_report, data, report_id)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the server process already runs threads
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=warm_up
+            )
+        return _executor
+
+def _replace_broken_executor(broken):
+    # A render process that crashed or was OOM-killed breaks the whole pool for good; the
+    # next report gets a fresh one. Only the pool that broke is dropped, so concurrent
+    # callers do not throw away each other's replacement.
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        _executor = None
+    broken.shutdown(wait=False)
+    print("⚠️ Report render pool broke; starting a new one")
+
+def _forget_finished_jobs():
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in ("done", "failed")]
+    for job_id in finished[:max(0, len(_jobs) - max_tracked)]:
+        del _jobs[job_id]
+
+def _on_rendered(report_id, executor, future):
+    global _pending
+    on_done = None
+    error = CancelledError("Render pool shut down") if future.cancelled() else future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _replace_broken_executor(executor)
+    with _lock:
+        _pending -= 1
+        job = _jobs.get(report_id)
+        if job is None:
+            return
+        job["finished_at"] = time.time()
+        if error is None:
+            job["status"] = "done"
+            on_done = job.get("on_done")
+            pdf_path, observations = future.result()
+            _clear_job_state(report_id)
+            metrics.record(observations)
+            # Queue wait plus render, as the client polling for the PDF experiences it
+            metrics.observe_stage("report_turnaround", job["finished_at"] - job["created_at"])
+        else:
+            job["status"] = "failed"
+            job["error"] = f"{type(error).__name__}: {error}"
+            print(f"❌ Report {report_id} failed: {job['error']}")
+            _save_job_state(report_id, "failed", job["created_at"], job["error"])
+
+    if on_done is not None:
+        try:
+            on_done(report_id, pdf_path)
+        except Exception as e:
+            print(f"⚠️ Report {report_id} post-processing failed: {e}")
+
+
+#Queue
+def submit_report(data, report_id=None, on_done=None):
+    # on_done(report_id, pdf_path) runs after a successful render
+    global _pending
+    report_id = report_id or new_report_id()
+    with _lock:
+        if _pending >= max_pending:
+            raise ReportQueueFull(f"{_pending} reports already queued")
+        _pending += 1
+        created_at = time.time()
+        _jobs[report_id] = {"status": "queued", "created_at": created_at, "on_done": on_done}
+        _forget_finished_jobs()
+
+    _save_job_state(report_id, "queued", created_at)
+    try:
+        executor = _get_executor()
+        try:
+            future = executor.submit(_render, data, report_id, created_at)
+        except BrokenProcessPool:
+            _replace_broken_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(_render, data, report_id, created_at)
+    except Exception:
+        with _lock:
+            _pending -= 1
+            _jobs.pop(report_id, None)
+        _clear_job_state(report_id)
+        raise
+
+    with _lock:
+        job = _jobs.get(report_id)
+        if job is not None:
+            job["future"] = future
+    future.add_done_callback(lambda f: _on_rendered(report_id, executor, f))
+    return report_id
+
+def report_status(report_id, fmt=None):
+    # fmt: only count a finished report of that format as done; None accepts any
+    with _lock:
+        job = _jobs.get(report_id)
+        if job is not None:
+            status = job["status"]
+            future = job.get("future")
+            if status == "queued" and future is not None and future.running():
+                status = "rendering"
+            info = {key: value for key, value in job.items() if key not in ("future", "on_done")}
+            info.update(report_id=report_id, status=status, queue_depth=_pending)
+            return info
+
+    # Reports rendered before a restart, and HTML/JSON reports, are only known by their file
+    if any(os.path.exists(report_path(report_id, f)) for f in ([fmt] if fmt else report_formats)):
+        return {"report_id": report_id, "status": "done"}
+    # Queued by another server worker
+    state = _load_job_state(report_id)
+    if state is not None:
+        state["report_id"] = report_id
+        return state
+    return None
+
+def queue_depth():
+    with _lock:
+        return _pending
+
+def shutdown(wait=True):
+    executor = _executor
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -0,0 +1,49 @@
+import ahocorasick
+
+
+class RuleMatcher:
+    # Finds every occurrence of a fixed set of phrases in a single pass over the text.
+    #
+    # All phrases are compiled once into an Aho-Corasick automaton, so a section is
+    # scanned exactly once no matter how many keywords, red flags and expected
+    # details the rules define. Overlapping and nested hits are all reported.
+
+    def __init__(self, patterns):
+        self.patterns = sorted({p for p in patterns if p})
+        self._automaton = ahocorasick.Automaton()
+        for pattern in self.patterns:
+            self._automaton.add_word(pattern, pattern)
+        if self.patterns:
+            self._automaton.make_automaton()
+
+    def find_matches(self, text):
+        # [(start, pattern), ...] in order of where each match ends
+        if not self.patterns:
+            return []
+        return [(end - len(pattern) + 1, pattern) for end, pattern in self._automaton.iter(text)]
+
+    def match_positions(self, text):
+        positions = {}
+        for start, pattern in sorted(self.find_matches(text)):
+            positions.setdefault(pattern, []).append(start)
+        return positions
+
+    def matched(self, text):
+        if not self.patterns:
+            return set()
+        return {pattern for _, pattern in self._automaton.iter(text)}
+
+
+#EB1A Rule Compilation
+def rule_patterns(rules, expectations):
+    patterns = []
+    for rule in rules.values():
+        patterns.extend(rule["keywords"])
+        patterns.extend(phrase for phrase, _ in rule["red_flags"])
+    for expected in expectations.values():
+        patterns.extend(keyword.lower() for keyword in expected)
+    return patterns
+
+def compile_rules(rules, expectations):
+    return RuleMatcher(rule_patterns(rules, expectations))
+
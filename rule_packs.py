@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from rule_matcher import compile_rules
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+rules_dir = os.path.join(base_dir, "rules")
+rule_pack_path = os.environ.get("EB1A_RULE_PACK", os.path.join(rules_dir, "eb1a.json"))
+# How often (seconds) the pack file is checked for changes; 0 turns the watch off
+watch_seconds = float(os.environ.get("EB1A_RULES_WATCH_SECONDS", "5"))
+
+
+class RulePackError(ValueError):
+    pass
+
+
+class RulePack:
+    # One loaded rule pack and everything compiled from it. Packs are never modified after
+    # loading: a reload compiles a new pack and swaps the active reference, so an analysis
+    # that holds a pack keeps using the same rules until it finishes.
+
+    def __init__(self, name, version, rules, expectations, path=None, mtime=None):
+        self.name = name
+        self.rules = rules
+        self.expectations = expectations
+        # The content hash changes the version even when an edit forgets to bump "version",
+        # so cached results from older rules are never reused
+        digest = hashlib.sha256(json.dumps([rules, expectations], sort_keys=True).encode("utf-8")).hexdigest()
+        self.version = f"{version}+{digest[:12]}"
+        self.matcher = compile_rules(rules, expectations)
+        self.path, self.mtime = path, mtime
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "path": self.path,
+            "criteria": len(self.rules),
+            "phrases": len(self.matcher.patterns),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at)),
+        }
+
+
+#Loading
+def _is_phrase_list(value):
+    return isinstance(value, list) and all(isinstance(phrase, str) and phrase for phrase in value)
+
+def validate_rule_pack(data):
+    # Raises RulePackError naming the first problem; a pack is checked fully before it is compiled
+    if not isinstance(data, dict):
+        raise RulePackError("A rule pack must be a JSON object")
+    for field in ("name", "version"):
+        if not isinstance(data.get(field), str) or not data[field]:
+            raise RulePackError(f"'{field}' must be a non-empty string")
+    rules = data.get("rules")
+    if not isinstance(rules, dict) or not rules:
+        raise RulePackError("'rules' must map each criterion to its rule")
+    for criterion, rule in rules.items():
+        if not isinstance(rule, dict) or not _is_phrase_list(rule.get("keywords")) or not rule["keywords"]:
+            raise RulePackError(f"{criterion}: 'keywords' must be a non-empty list of phrases")
+        flags = rule.get("red_flags", [])
+        if not isinstance(flags, list) or not all(
+            isinstance(flag, list) and len(flag) == 2 and _is_phrase_list(flag) for flag in flags
+        ):
+            raise RulePackError(f"{criterion}: 'red_flags' must be a list of [phrase, message] pairs")
+        # Sections are lowercased before matching, so a phrase with capitals could never match
+        for phrase in rule["keywords"] + [flag[0] for flag in flags]:
+            if phrase != phrase.lower():
+                raise RulePackError(f"{criterion}: phrase {phrase!r} must be lowercase")
+    expectations = data.get("evidence_expectations", {})
+    if not isinstance(expectations, dict):
+        raise RulePackError("'evidence_expectations' must map criteria to lists of details")
+    for criterion, expected in expectations.items():
+        if criterion not in rules:
+            raise RulePackError(f"evidence_expectations names unknown criterion {criterion!r}")
+        if not _is_phrase_list(expected):
+            raise RulePackError(f"{criterion}: expected details must be a list of phrases")
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load_rule_pack(path=rule_pack_path):
+    stamp = _file_stamp(path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except OSError as e:
+        raise RulePackError(f"Cannot read rule pack {path}: {e}")
+    except ValueError as e:
+        raise RulePackError(f"Rule pack {path} is not valid JSON: {e}")
+    validate_rule_pack(data)
+    for rule in data["rules"].values():
+        rule.setdefault("red_flags", [])
+    return RulePack(
+        data["name"], data["version"], data["rules"], data.get("evidence_expectations", {}), path=path, mtime=stamp,
+    )
+
+
+#Active Pack
+_active = None
+_lock = threading.Lock()
+_checked_at = 0.0
+# File stamp of a pack that failed to load, so a broken edit is reported once, not every check
+_rejected = None
+
+def reload_rule_pack(path=None):
+    # Compiles the pack first and swaps it in only if that succeeded; analyses already
+    # running keep the pack they started with
+    global _active, _rejected
+    with _lock:
+        pack = load_rule_pack(path or (_active.path if _active is not None else rule_pack_path))
+        previous = _active
+        _active = pack
+        _rejected = None
+    if previous is None or previous.version != pack.version:
+        print(f"📐 Rule pack {pack.name} {pack.version} loaded ({len(pack.matcher.patterns)} phrases)")
+    return pack
+
+def active_pack():
+    # The pack for one analysis. Callers keep the returned object for the whole document,
+    # so a reload in the middle of a request never mixes two rule versions.
+    global _checked_at, _rejected
+    pack = _active
+    if pack is None:
+        return reload_rule_pack()
+    if watch_seconds > 0 and time.monotonic() - _checked_at >= watch_seconds:
+        _checked_at = time.monotonic()
+        stamp = _file_stamp(pack.path)
+        if stamp is not None and stamp != pack.mtime and stamp != _rejected:
+            try:
+                return reload_rule_pack()
+            except RulePackError as e:
+                _rejected = stamp
+                print(f"⚠️ Keeping rule pack {pack.version}: {e}")
+    return _active
@@ -0,0 +1,32 @@
+import os
+import sys
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from analyzer import letters_or_whole_document
+
+
+letter = (
+    "To whom it may concern,\n"
+    "I am writing to recommend Dr. Smith, whose work on catalysts changed the field.\n"
+    "Sincerely,\nProf. Lee"
+)
+draft = (
+    "Introduction\nThe petitioner is an accomplished researcher.\n"
+    "Criterion 3: Published material\nArticles in major media discuss the work.\n"
+    "Respectfully submitted,\nCounsel"
+)
+decision = "The petitioner has not shown eligibility under 8 C.F.R. § 204.5(h)(3)(iii). " * 120
+
+
+def test_standalone_letter_is_one_letter():
+    assert letters_or_whole_document(letter, "letter.pdf") == [("letter.pdf", letter)]
+
+def test_drafts_and_decisions_are_not_indexed_whole():
+    assert letters_or_whole_document(draft, "v2.txt") == []
+    assert letters_or_whole_document(decision, "decision.pdf") == []
+
+def test_letter_headers_win_over_the_fallback():
+    text = "Letter from Prof. Lee\nDear officer, I recommend Dr. Smith.\n"
+    assert letters_or_whole_document(text, "filing.pdf") == [("Letter from Prof. Lee", "Dear officer, I recommend Dr. Smith.")]
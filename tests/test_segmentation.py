@@ -0,0 +1,51 @@
+import os
+import sys
+import random
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from analyzer import DocumentSegmenter, segment_document
+
+
+# Headers, whitespace runs that header patterns can cross, and body text
+fragments = [
+    "Criterion 1: Awards\n", "Criterion 3 -", " Published material", "Criterion 8:\n \n",
+    "Letter from Prof. Lee\n", "Recommendation Letter from  \n", "Dr. Jane Smith, MIT\n",
+    "letter FROM\n\n", "Ms. Doe", "I recommend the applicant strongly.\n", "The award is national.",
+    " ", "  \n", "\n\n", "\t", "Criterion", " 2", ": Membership", "Recommendation", " Letter", " from",
+]
+
+
+def one_shot(text):
+    return {kind: [(view.header, view.body) for view in views] for kind, views in segment_document(text).items()}
+
+def streamed(pages, lookback=256):
+    segmenter = DocumentSegmenter(lookback=lookback)
+    sections = []
+    for page in pages:
+        sections.extend(segmenter.feed(page))
+    sections.extend(segmenter.close())
+    return {
+        kind: [(header, body) for section_kind, header, body in sections if section_kind == kind]
+        for kind in ("criterion", "letter")
+    }
+
+def random_pages(rng, text):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 12))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_header_name_on_next_page():
+    pages = ["Intro\nRecommendation Letter from  \n", "Dr. Jane Smith, MIT\nI recommend the applicant strongly.\n"]
+    assert streamed(pages) == one_shot("".join(pages))
+    assert streamed(pages)["letter"][0][0] == "Recommendation Letter from  \nDr. Jane Smith, MIT"
+
+def test_random_page_splits_match_one_shot():
+    rng = random.Random(20240601)
+    for _ in range(500):
+        text = "Intro\n" + "".join(rng.choice(fragments) for _ in range(rng.randint(1, 40)))
+        expected = one_shot(text)
+        for lookback in (64, 256):
+            pages = random_pages(rng, text)
+            assert streamed(pages, lookback) == expected, pages
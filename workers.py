@@ -0,0 +1,145 @@
+import io
+import os
+import asyncio
+import zipfile
+import functools
+import threading
+import multiprocessing
+
+import metrics
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# "thread" keeps everything in the server process; "process" sidesteps the GIL for
+# PyMuPDF parsing and the rule engine at the cost of pickling each upload once
+executor_kind = os.environ.get("EB1A_EXECUTOR", "thread")
+max_workers = int(os.environ.get("EB1A_ANALYSIS_WORKERS", str(os.cpu_count() or 1)))
+# Requests being analyzed at once (including ones waiting for a worker); beyond this → 503
+max_inflight = int(os.environ.get("EB1A_MAX_INFLIGHT", str(max_workers * 2)))
+max_upload_bytes = int(os.environ.get("EB1A_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Limits for /analyze/batch/, counted after zip archives are expanded
+max_batch_bytes = int(os.environ.get("EB1A_MAX_BATCH_BYTES", str(200 * 1024 * 1024)))
+max_batch_files = int(os.environ.get("EB1A_MAX_BATCH_FILES", "50"))
+upload_chunk_bytes = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+#Executor
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if executor_kind == "process":
+                _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            elif executor_kind == "thread":
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+            else:
+                raise ValueError(f"EB1A_EXECUTOR must be 'thread' or 'process', not {executor_kind!r}")
+        return _executor
+
+def _replace_broken_executor(broken):
+    # One analysis process that crashed or was OOM-killed breaks the whole pool for good;
+    # only the pool that broke is dropped, so concurrent requests share one replacement
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        _executor = None
+    broken.shutdown(wait=False)
+    print("⚠️ Analysis process pool broke; starting a new one")
+
+async def run_cpu_bound(func, *args, **kwargs):
+    # Stage timings recorded by func come back with the result and are replayed here, so
+    # /metrics and request profiles see them whichever executor kind ran the work
+    loop = asyncio.get_running_loop()
+    call = functools.partial(metrics.call_collected, func, *args, **kwargs)
+    executor = get_executor()
+    try:
+        result, observations = await loop.run_in_executor(executor, call)
+    except BrokenProcessPool:
+        # Retried once on a fresh pool; a document that crashes that one too fails the request
+        _replace_broken_executor(executor)
+        result, observations = await loop.run_in_executor(get_executor(), call)
+    metrics.record(observations)
+    return result
+
+def shutdown(wait=True):
+    executor = _executor
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+#Admission Control
+class AdmissionLimiter:
+    # Counts requests on the event loop thread, so no lock is needed. try_acquire never
+    # waits: a full server answers 503 straight away instead of queueing the upload.
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self):
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+
+analysis_slots = AdmissionLimiter(max_inflight)
+
+
+#Uploads
+async def read_upload(file, limit=max_upload_bytes, chunk_size=upload_chunk_bytes, digest=None):
+    # `digest` (a hashlib object) is fed chunk by chunk, so hashing never blocks on the full file
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+        if len(buffer) > limit:
+            raise UploadTooLarge(f"Upload exceeds {limit} bytes")
+        if digest is not None:
+            digest.update(chunk)
+
+def expand_zip_uploads(uploads, extensions, limit=max_batch_bytes, max_files=max_batch_files):
+    # [(filename, bytes)] with every .zip replaced by its supported members. Sizes are
+    # enforced on the bytes actually read, not on what the archive headers claim.
+    expanded = []
+    total = 0
+
+    def add(name, data):
+        nonlocal total
+        total += len(data)
+        if total > limit:
+            raise UploadTooLarge(f"Batch exceeds {limit} bytes")
+        if len(expanded) >= max_files:
+            raise UploadTooLarge(f"Batch exceeds {max_files} files")
+        expanded.append((name, data))
+
+    for filename, data in uploads:
+        if not filename.lower().endswith(".zip"):
+            add(filename, data)
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in archive.infolist():
+                name = member.filename
+                base = os.path.basename(name)
+                if member.is_dir() or base.startswith(".") or "__MACOSX" in name:
+                    continue
+                if not base.lower().endswith(extensions):
+                    continue
+                with archive.open(member) as f:
+                    add(f"{filename}/{name}", f.read(limit - total + 1))
+    return expanded